@@ -0,0 +1,115 @@
+"""
+单机批量处理多个PDF，并行度由 ConcurrencyGovernor 按资源占用自动调整
+
+每个文件在一个线程中处理（渲染由 pdftoppm 子进程完成，OpenCV 计算时会释放GIL，
+线程足以用满多个核），所有线程共享同一个页面名额，内存吃紧时下一页开始前就会等待。
+
+用法：
+    python src/batch.py a.pdf b.pdf --output-dir out/ --max-workers 8 --memory-limit 2048
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from governor import ConcurrencyGovernor
+from split_pdf_opencv import process_pdf_with_opencv
+
+
+def run_batch(jobs, governor, interval=1.0, on_result=None, **process_kwargs):
+    """
+    并行处理一批文件，每隔 interval 秒让调节器做一次决策，并按其结果增减工作线程
+
+    工作数减少时不会打断正在处理的文件，只是在它们完成前不再启动新的。
+
+    Args:
+        jobs: [(输入PDF路径, 输出PDF路径)]
+        governor: ConcurrencyGovernor
+        interval: 调节间隔（秒）
+        on_result: 每个文件完成时的回调，接收 (输入路径, 统计信息或None, 异常或None)
+        **process_kwargs: 传给 process_pdf_with_opencv 的其它参数
+
+    Returns:
+        {输入路径: 统计信息}，失败的文件对应的值为异常对象
+    """
+    pending = deque(enumerate(jobs))
+    running = {}
+    results = {}
+    finished = threading.Event()
+    lock = threading.Lock()
+
+    def work(job_index, input_pdf, output_path):
+        stats, error = None, None
+        try:
+            stats = process_pdf_with_opencv(input_pdf, output_path,
+                                            page_gate=governor.page_gate, **process_kwargs)
+        except Exception as e:
+            error = e
+        with lock:
+            results[input_pdf] = stats if error is None else error
+            del running[job_index]
+        if on_result:
+            on_result(input_pdf, stats, error)
+        finished.set()
+
+    while pending or running:
+        with lock:
+            active = len(running)
+        governor.update(queue_depth=len(pending), active_workers=active)
+
+        with lock:
+            while pending and len(running) < governor.target_workers:
+                job_index, (input_pdf, output_path) = pending.popleft()
+                thread = threading.Thread(target=work, args=(job_index, input_pdf, output_path),
+                                          daemon=True)
+                running[job_index] = thread
+                thread.start()
+
+        finished.wait(interval)
+        finished.clear()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="按资源占用自动调整并行度的批量处理")
+    parser.add_argument("pdfs", nargs="+", help="输入PDF文件")
+    parser.add_argument("--output-dir", required=True, help="输出目录")
+    parser.add_argument("--min-workers", type=int, default=1, help="最少并行文件数")
+    parser.add_argument("--max-workers", type=int, default=None, help="最多并行文件数，默认CPU核数")
+    parser.add_argument("--max-inflight-pages", type=int, default=None,
+                        help="同时渲染和检测的页数上限，默认与并行文件数相同")
+    parser.add_argument("--memory-limit", type=int, default=None, help="内存上限（MB）")
+    parser.add_argument("--target-cpu", type=float, default=0.85,
+                        help="CPU占用低于该比例且还有待处理文件时增加并行")
+    parser.add_argument("--metrics", default=None, help="把调节决策以 JSON Lines 写入该文件")
+    parser.add_argument("--optimize", choices=["none", "fast", "max"], default="fast",
+                        help="输出优化预设")
+    args = parser.parse_args()
+
+    governor = ConcurrencyGovernor(
+        min_workers=args.min_workers, max_workers=args.max_workers,
+        memory_limit_mb=args.memory_limit, target_cpu=args.target_cpu,
+        max_inflight_pages=args.max_inflight_pages, metrics_path=args.metrics,
+    )
+
+    jobs = []
+    for input_pdf in args.pdfs:
+        base_name = os.path.splitext(os.path.basename(input_pdf))[0]
+        jobs.append((input_pdf, os.path.join(args.output_dir, f"{base_name}_processed.pdf")))
+
+    def on_result(input_pdf, stats, error):
+        if error is not None:
+            print(f"处理失败 {input_pdf}: {error}")
+        else:
+            print(f"完成 {input_pdf}: {stats['total_receipts']} 个回执单，"
+                  f"耗时 {stats['seconds']:.1f} 秒")
+
+    start = time.perf_counter()
+    results = run_batch(jobs, governor, on_result=on_result, output_options=args.optimize)
+    failed = sum(1 for value in results.values() if isinstance(value, Exception))
+    print(f"共 {len(results)} 个文件，失败 {failed} 个，耗时 {time.perf_counter() - start:.1f} 秒")
+    print("并行调节：" + json.dumps(governor.metrics(), ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
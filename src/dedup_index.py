@@ -0,0 +1,293 @@
+"""
+回执单去重索引
+
+为每个输出的回执单记录两种指纹，持久化保存在SQLite中：
+- 页面内容哈希：原始页面内容流和图像数据（未解码）的SHA-1。同一页再次出现时（重复上传、
+  日期范围重叠的对账单），不需要渲染和检测就能知道它的回执单都已经处理过
+- 感知哈希：裁剪区域缩略图的64位pHash，用于识别页面字节不同但内容相同的回执单
+
+同一模板的不同回执单（只有金额、日期等文字不同）在8x8的感知哈希上几乎一样，
+因此候选记录还要再用更细的 128x48 灰度签名确认：几乎没有明显不同的像素才视为重复。
+这个判断偏保守，宁可漏掉重新扫描造成错位的重复件，也不能把不同的回执单当作重复丢掉。
+
+查找分两步，每步取出的候选数都有上限，与索引中的记录数无关：
+1. 细粒度签名量化后的哈希（detail_key）做等值查找：同一回执单再次渲染得到的签名相同，
+   而同一模板的不同回执单文字不同，哈希也不同，因此即使同一模板有大量记录也只命中真正的重复件
+2. 感知哈希按16位拆成4段分别建索引（多索引哈希）：汉明距离不超过3的两个哈希至少有一段完全相同，
+   用于找出签名略有差异的重复件（如重新扫描）。同一模板的记录在这里都是候选，
+   候选超过 max_candidates 条时不再逐一比较，只认第1步的结果
+"""
+import hashlib
+import sqlite3
+import time
+import zlib
+
+import cv2
+import numpy as np
+from pypdf.generic import ArrayObject
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS receipts (
+    id INTEGER PRIMARY KEY,
+    phash INTEGER NOT NULL,
+    detail BLOB NOT NULL,
+    detail_key INTEGER NOT NULL,
+    band0 INTEGER NOT NULL,
+    band1 INTEGER NOT NULL,
+    band2 INTEGER NOT NULL,
+    band3 INTEGER NOT NULL,
+    page_hash TEXT NOT NULL,
+    source TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    receipt_index INTEGER NOT NULL,
+    output_path TEXT NOT NULL,
+    output_index INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS receipts_detail_key ON receipts(detail_key);
+CREATE INDEX IF NOT EXISTS receipts_band0 ON receipts(band0);
+CREATE INDEX IF NOT EXISTS receipts_band1 ON receipts(band1);
+CREATE INDEX IF NOT EXISTS receipts_band2 ON receipts(band2);
+CREATE INDEX IF NOT EXISTS receipts_band3 ON receipts(band3);
+CREATE INDEX IF NOT EXISTS receipts_page_hash ON receipts(page_hash);
+CREATE TABLE IF NOT EXISTS links (
+    id INTEGER PRIMARY KEY,
+    receipt_id INTEGER NOT NULL REFERENCES receipts(id),
+    page_hash TEXT NOT NULL,
+    source TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    receipt_index INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS links_page_hash ON links(page_hash);
+-- 同一个来源位置指向同一条记录的链接只保留一条，重复运行同一文件不会增加链接
+CREATE UNIQUE INDEX IF NOT EXISTS links_unique ON links(receipt_id, source, page, receipt_index);
+CREATE TABLE IF NOT EXISTS pages (
+    page_hash TEXT PRIMARY KEY,
+    receipts INTEGER NOT NULL
+);
+-- 页面中每个回执单对应的记录ID（新输出的回执单或它重复的已有记录）
+CREATE TABLE IF NOT EXISTS page_receipts (
+    page_hash TEXT NOT NULL,
+    receipt_index INTEGER NOT NULL,
+    receipt_id INTEGER NOT NULL REFERENCES receipts(id),
+    PRIMARY KEY (page_hash, receipt_index)
+);
+"""
+
+# 多索引哈希的段数决定了能保证查全的最大汉明距离
+MAX_SUPPORTED_DISTANCE = 3
+
+
+def _stream_bytes(obj):
+    """取流对象的原始（未解码）数据"""
+    data = getattr(obj, "_data", None)
+    return data if data is not None else obj.get_data()
+
+def page_content_hash(page):
+    """
+    计算页面内容哈希：页面尺寸 + 内容流 + 引用的外部对象（图像等）的原始数据
+
+    只读取原始字节，不解码也不渲染。
+    """
+    digest = hashlib.sha1()
+    digest.update(repr([float(v) for v in page.mediabox]).encode())
+
+    contents = page.get("/Contents")
+    if contents is not None:
+        contents = contents.get_object()
+        if not isinstance(contents, ArrayObject):
+            contents = [contents]
+        for stream in contents:
+            digest.update(_stream_bytes(stream.get_object()))
+
+    resources = page.get("/Resources")
+    xobjects = resources.get_object().get("/XObject") if resources is not None else None
+    if xobjects is not None:
+        xobjects = xobjects.get_object()
+        for name in sorted(xobjects):
+            digest.update(name.encode())
+            digest.update(_stream_bytes(xobjects[name].get_object()))
+
+    return digest.hexdigest()
+
+def perceptual_hash(gray):
+    """
+    计算灰度图的64位感知哈希（pHash）：缩小到32x32，取DCT低频8x8系数与中位数比较
+    """
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()
+    # 直流分量只反映整体亮度，不参与中位数计算
+    bits = low > np.median(low[1:])
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+# 细粒度签名的尺寸（宽, 高），以及两个像素被视为不同所需的灰度差
+DETAIL_SIZE = (128, 48)
+DETAIL_PIXEL_TOLERANCE = 24
+
+def detail_signature(gray):
+    """计算用于确认重复的细粒度签名：缩小到 DETAIL_SIZE 的灰度图，压缩后保存"""
+    small = cv2.resize(gray, DETAIL_SIZE, interpolation=cv2.INTER_AREA)
+    return zlib.compress(small.tobytes())
+
+# 计算 detail_key 时灰度量化的位数（256级灰度量化为4级）
+DETAIL_KEY_SHIFT = 6
+
+def detail_key(detail):
+    """细粒度签名量化后的64位哈希，用于等值查找完全相同的回执单"""
+    pixels = np.frombuffer(zlib.decompress(detail), dtype=np.uint8) >> DETAIL_KEY_SHIFT
+    return int.from_bytes(hashlib.sha1(pixels.tobytes()).digest()[:8], "big", signed=True)
+
+def detail_difference(a, b):
+    """两个细粒度签名中明显不同的像素比例"""
+    pixels_a = np.frombuffer(zlib.decompress(a), dtype=np.uint8).astype(np.int16)
+    pixels_b = np.frombuffer(zlib.decompress(b), dtype=np.uint8).astype(np.int16)
+    return np.count_nonzero(np.abs(pixels_a - pixels_b) > DETAIL_PIXEL_TOLERANCE) / len(pixels_a)
+
+def _to_signed(value):
+    """SQLite的INTEGER是有符号64位"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+def _bands(phash):
+    return [(phash >> (16 * i)) & 0xFFFF for i in range(4)]
+
+
+class DedupIndex:
+    """
+    持久化的回执单指纹索引
+
+    写入在同一个事务中累积，调用方在输出文件成功写入后 commit()，失败时 rollback()，
+    避免索引指向不存在的输出。
+
+    Args:
+        db_path: 数据库文件路径
+        max_distance: 感知哈希的汉明距离不超过该值即为候选，最大为3
+        max_detail_difference: 候选与当前回执单的细粒度签名中明显不同的像素比例不超过该值才视为重复
+        max_candidates: 每一步查找最多比较的候选数；感知哈希的候选超过该值时放弃近似查找
+    """
+
+    def __init__(self, db_path, max_distance=2, max_detail_difference=0.001, max_candidates=256):
+        if not 0 <= max_distance <= MAX_SUPPORTED_DISTANCE:
+            raise ValueError(f"max_distance 必须在 0~{MAX_SUPPORTED_DISTANCE} 之间")
+        self.max_distance = max_distance
+        self.max_detail_difference = max_detail_difference
+        self.max_candidates = max_candidates
+        self.conn = sqlite3.connect(db_path, timeout=60)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def page_receipt_ids(self, page_hash):
+        """
+        查询已处理过的页面
+
+        Returns:
+            该页回执单按顺序对应的索引记录ID列表（可能为空列表，例如空白页）；
+            页面没有处理过时返回None
+        """
+        row = self.conn.execute(
+            "SELECT receipts FROM pages WHERE page_hash = ?", (page_hash,)
+        ).fetchone()
+        if row is None:
+            return None
+        ids = self.conn.execute(
+            "SELECT receipt_id FROM page_receipts WHERE page_hash = ? ORDER BY receipt_index",
+            (page_hash,)
+        ).fetchall()
+        return [receipt_id for (receipt_id,) in ids]
+
+    def find_receipt(self, phash, detail):
+        """
+        查找重复的回执单：先按签名哈希等值查找，找不到再按感知哈希找候选，都用细粒度签名确认
+
+        Returns:
+            最相似的记录ID，没有重复时返回None
+        """
+        rows = self.conn.execute(
+            "SELECT id, phash, detail FROM receipts WHERE detail_key = ? LIMIT ?",
+            (detail_key(detail), self.max_candidates)
+        ).fetchall()
+        best_id = self._best_match(rows, phash, detail)
+        if best_id is not None:
+            return best_id
+
+        # 只取ID和感知哈希，超过上限（通常是同一模板的大量回执单）时不再比较
+        rows = self.conn.execute(
+            "SELECT id, phash FROM receipts "
+            "WHERE band0 = ? OR band1 = ? OR band2 = ? OR band3 = ? LIMIT ?",
+            (*_bands(phash), self.max_candidates + 1)
+        ).fetchall()
+        if len(rows) > self.max_candidates:
+            return None
+        ids = [receipt_id for receipt_id, stored in rows if self._close(stored, phash)]
+        if not ids:
+            return None
+        rows = self.conn.execute(
+            f"SELECT id, phash, detail FROM receipts WHERE id IN ({','.join('?' * len(ids))})", ids
+        ).fetchall()
+        return self._best_match(rows, phash, detail)
+
+    def _close(self, stored, phash):
+        return bin((stored & 0xFFFFFFFFFFFFFFFF) ^ phash).count("1") <= self.max_distance
+
+    def _best_match(self, rows, phash, detail):
+        """在 (id, phash, detail) 候选中找出确认为重复且差异最小的记录"""
+        best_id, best_difference = None, None
+        for receipt_id, stored, stored_detail in rows:
+            if not self._close(stored, phash):
+                continue
+            difference = detail_difference(stored_detail, detail)
+            if difference <= self.max_detail_difference and (
+                    best_difference is None or difference < best_difference):
+                best_id, best_difference = receipt_id, difference
+        return best_id
+
+    def add_receipt(self, phash, detail, page_hash, source, page, receipt_index, output_path, output_index):
+        """记录一个新输出的回执单，返回记录ID"""
+        cursor = self.conn.execute(
+            "INSERT INTO receipts (phash, detail, detail_key, band0, band1, band2, band3, page_hash, "
+            "source, page, receipt_index, output_path, output_index, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (_to_signed(phash), detail, detail_key(detail), *_bands(phash), page_hash, source, page,
+             receipt_index,
+             output_path, output_index, time.time())
+        )
+        return cursor.lastrowid
+
+    def add_link(self, receipt_id, page_hash, source, page, receipt_index):
+        """记录一个重复的回执单指向已有的记录，同一位置已经记录过时忽略"""
+        self.conn.execute(
+            "INSERT OR IGNORE INTO links (receipt_id, page_hash, source, page, receipt_index, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (receipt_id, page_hash, source, page, receipt_index, time.time())
+        )
+
+    def add_page(self, page_hash, receipt_ids):
+        """
+        记录一个处理过的页面
+
+        Args:
+            page_hash: 页面内容哈希
+            receipt_ids: 该页回执单按顺序对应的记录ID，重复的回执单为它重复的已有记录
+        """
+        cursor = self.conn.execute(
+            "INSERT OR IGNORE INTO pages (page_hash, receipts) VALUES (?, ?)",
+            (page_hash, len(receipt_ids))
+        )
+        if cursor.rowcount:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO page_receipts (page_hash, receipt_index, receipt_id) "
+                "VALUES (?, ?, ?)",
+                [(page_hash, idx, receipt_id) for idx, receipt_id in enumerate(receipt_ids)]
+            )
@@ -0,0 +1,585 @@
+"""
+多进程/多机分片处理
+
+把PDF按页码范围切成若干分片放入一个SQLite工作队列，多个工作进程（可以在同一台机器上，
+也可以在共享同一文件系统的多台机器上）以租约方式领取分片并调用 process_pdf_with_opencv 处理。
+工作进程崩溃后其租约到期，分片会被重新放回队列；所有分片完成后按页码顺序合并为最终输出。
+不依赖任何外部消息队列。
+
+数据库使用默认的回滚日志模式而不是WAL，因为WAL依赖共享内存，不能在网络文件系统上跨机器使用。
+
+用法：
+    python src/distributed.py enqueue queue.db a.pdf b.pdf --output-dir out/ --chunk-pages 50
+    python src/distributed.py worker queue.db --processes 4
+    python src/distributed.py worker queue.db --processes 1 --max-processes 8 --memory-limit 4096
+    python src/distributed.py status queue.db
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+
+from pypdf import PdfWriter
+
+from governor import ConcurrencyGovernor
+from page_loader import LazyPageTree
+from split_pdf_opencv import DetectionConfig, ProcessingControl, ProcessingCancelled, process_pdf_with_opencv
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    input_pdf TEXT NOT NULL,
+    output_path TEXT NOT NULL,
+    total_pages INTEGER NOT NULL,
+    config TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'open',     -- open / merging / done / failed
+    merge_owner TEXT,
+    merge_expires REAL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    job_id INTEGER NOT NULL REFERENCES jobs(id),
+    page_start INTEGER NOT NULL,             -- 从0开始，包含
+    page_end INTEGER NOT NULL,               -- 不包含
+    status TEXT NOT NULL DEFAULT 'pending',  -- pending / leased / done / failed
+    lease_owner TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    part_path TEXT,
+    stats TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS items_by_status ON items(status, job_id, page_start);
+CREATE INDEX IF NOT EXISTS items_by_job ON items(job_id, page_start);
+"""
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class WorkQueue:
+    """
+    基于SQLite的持久化工作队列
+
+    所有状态变更都在 BEGIN IMMEDIATE 事务中完成，多个进程同时领取时不会拿到同一个分片。
+
+    Args:
+        db_path: 数据库文件路径
+        lease_seconds: 租约时长，工作进程需要在到期前续约
+        max_attempts: 单个分片最多尝试次数，超过后标记为失败
+    """
+
+    def __init__(self, db_path, lease_seconds=300, max_attempts=3):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.conn = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def _transaction(self):
+        return _Transaction(self.conn)
+
+    def enqueue_file(self, input_pdf, output_path, chunk_pages=50, config=None):
+        """
+        把一个PDF按页码范围切片入队
+
+        Returns:
+            任务ID
+        """
+        # 只读页面树根节点的页数，不把整个文件读入内存
+        with LazyPageTree(input_pdf) as page_tree:
+            total_pages = page_tree.page_count
+        config = config or DetectionConfig()
+        with self._transaction():
+            cursor = self.conn.execute(
+                "INSERT INTO jobs (input_pdf, output_path, total_pages, config, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (os.path.abspath(input_pdf), os.path.abspath(output_path), total_pages,
+                 json.dumps(config.to_dict()), time.time())
+            )
+            job_id = cursor.lastrowid
+            self.conn.executemany(
+                "INSERT INTO items (job_id, page_start, page_end) VALUES (?, ?, ?)",
+                [(job_id, start, min(start + chunk_pages, total_pages))
+                 for start in range(0, total_pages, chunk_pages)]
+            )
+        return job_id
+
+    def _requeue_expired(self, now):
+        """租约已过期的分片重新入队，超过最大尝试次数的标记为失败"""
+        self.conn.execute(
+            "UPDATE items SET status = 'failed', error = '租约过期次数过多', lease_owner = NULL "
+            "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+            (now, self.max_attempts)
+        )
+        self.conn.execute(
+            "UPDATE items SET status = 'pending', lease_owner = NULL, lease_expires = NULL "
+            "WHERE status = 'leased' AND lease_expires < ?",
+            (now,)
+        )
+        self.conn.execute(
+            "UPDATE jobs SET status = 'open', merge_owner = NULL, merge_expires = NULL "
+            "WHERE status = 'merging' AND merge_expires < ?",
+            (now,)
+        )
+
+    def claim(self, worker_id):
+        """
+        领取一个待处理分片
+
+        Returns:
+            分片信息字典（含任务的输入、输出和检测参数），没有可领取的分片时返回None
+        """
+        now = time.time()
+        with self._transaction():
+            self._requeue_expired(now)
+            row = self.conn.execute(
+                "SELECT items.*, jobs.input_pdf, jobs.output_path, jobs.config FROM items "
+                "JOIN jobs ON jobs.id = items.job_id "
+                "WHERE items.status = 'pending' ORDER BY items.job_id, items.page_start LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute(
+                "UPDATE items SET status = 'leased', lease_owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1 WHERE id = ?",
+                (worker_id, now + self.lease_seconds, row["id"])
+            )
+        return dict(row)
+
+    def renew(self, item_id, worker_id):
+        """续约；租约已经不属于该工作进程时返回False"""
+        with self._transaction():
+            cursor = self.conn.execute(
+                "UPDATE items SET lease_expires = ? "
+                "WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                (time.time() + self.lease_seconds, item_id, worker_id)
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, item_id, worker_id, part_path, stats):
+        """标记分片完成；租约已经丢失时返回False，结果作废"""
+        with self._transaction():
+            cursor = self.conn.execute(
+                "UPDATE items SET status = 'done', part_path = ?, stats = ?, "
+                "lease_owner = NULL, lease_expires = NULL "
+                "WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                (part_path, json.dumps(stats), item_id, worker_id)
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, item_id, worker_id, error):
+        """处理出错：未超过最大尝试次数时重新入队，否则标记为失败"""
+        with self._transaction():
+            self.conn.execute(
+                "UPDATE items SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "error = ?, lease_owner = NULL, lease_expires = NULL "
+                "WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                (self.max_attempts, error, item_id, worker_id)
+            )
+
+    def claim_merge(self, worker_id):
+        """
+        领取一个所有分片都已完成、等待合并的任务
+
+        Returns:
+            (任务信息字典, 按页码排序的分片列表)，没有时返回None
+        """
+        now = time.time()
+        with self._transaction():
+            self._requeue_expired(now)
+            job = self.conn.execute(
+                "SELECT * FROM jobs WHERE status = 'open' AND NOT EXISTS ("
+                "SELECT 1 FROM items WHERE items.job_id = jobs.id AND items.status != 'done'"
+                ") ORDER BY id LIMIT 1"
+            ).fetchone()
+            if job is None:
+                return None
+            self.conn.execute(
+                "UPDATE jobs SET status = 'merging', merge_owner = ?, merge_expires = ? WHERE id = ?",
+                (worker_id, now + self.lease_seconds, job["id"])
+            )
+            items = self.conn.execute(
+                "SELECT * FROM items WHERE job_id = ? ORDER BY page_start", (job["id"],)
+            ).fetchall()
+        return dict(job), [dict(item) for item in items]
+
+    def renew_merge(self, job_id, worker_id):
+        """合并租约续约；租约已经不属于该工作进程时返回False"""
+        with self._transaction():
+            cursor = self.conn.execute(
+                "UPDATE jobs SET merge_expires = ? "
+                "WHERE id = ? AND merge_owner = ? AND status = 'merging'",
+                (time.time() + self.lease_seconds, job_id, worker_id)
+            )
+        return cursor.rowcount == 1
+
+    def finish_job(self, job_id, worker_id, status="done"):
+        with self._transaction():
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, merge_owner = NULL, merge_expires = NULL "
+                "WHERE id = ? AND merge_owner = ?",
+                (status, job_id, worker_id)
+            )
+
+    def mark_failed_jobs(self):
+        """有分片最终失败的任务整体标记为失败"""
+        with self._transaction():
+            self.conn.execute(
+                "UPDATE jobs SET status = 'failed' WHERE status = 'open' AND EXISTS ("
+                "SELECT 1 FROM items WHERE items.job_id = jobs.id AND items.status = 'failed')"
+            )
+
+    def has_unfinished_work(self):
+        row = self.conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status IN ('open', 'merging')"
+        ).fetchone()
+        return row[0] > 0
+
+    def pending_count(self):
+        """等待领取的分片数"""
+        row = self.conn.execute("SELECT COUNT(*) FROM items WHERE status = 'pending'").fetchone()
+        return row[0]
+
+    def status(self):
+        """每个任务的分片完成情况"""
+        rows = self.conn.execute(
+            "SELECT jobs.id, jobs.input_pdf, jobs.status, jobs.total_pages, "
+            "SUM(items.status = 'done') AS done, SUM(items.status = 'leased') AS leased, "
+            "SUM(items.status = 'pending') AS pending, SUM(items.status = 'failed') AS failed, "
+            "COUNT(items.id) AS total FROM jobs JOIN items ON items.job_id = jobs.id "
+            "GROUP BY jobs.id ORDER BY jobs.id"
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT，出错时回滚"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+        return False
+
+
+def parts_dir_for(output_path):
+    return output_path + ".parts"
+
+def process_item(work_queue, item, worker_id):
+    """
+    处理一个分片，处理过程中借助进度回调续约
+
+    租约丢失（例如处理太慢、被判定为崩溃）时立即放弃该分片。
+    """
+    parts_dir = parts_dir_for(item["output_path"])
+    os.makedirs(parts_dir, exist_ok=True)
+    # 文件名带上工作进程ID，租约过期后被重新领取时不会与旧的结果互相覆盖
+    part_path = os.path.join(
+        parts_dir, f"{item['page_start']:06d}-{item['page_end']:06d}.{worker_id}.pdf"
+    )
+
+    control = ProcessingControl()
+    last_renew = [time.time()]
+
+    def progress_event_callback(event):
+        if time.time() - last_renew[0] < work_queue.lease_seconds / 3:
+            return
+        last_renew[0] = time.time()
+        if not work_queue.renew(item["id"], worker_id):
+            control.cancel()
+
+    try:
+        stats = process_pdf_with_opencv(
+            item["input_pdf"], part_path,
+            config=DetectionConfig.from_dict(json.loads(item["config"])),
+            control=control,
+            progress_event_callback=progress_event_callback,
+            progress_interval=1.0,
+            pages=range(item["page_start"], item["page_end"]),
+        )
+    except ProcessingCancelled:
+        return False
+    except Exception as e:
+        work_queue.fail(item["id"], worker_id, f"{type(e).__name__}: {e}")
+        return False
+
+    if not work_queue.complete(item["id"], worker_id, part_path, stats):
+        os.remove(part_path)
+        return False
+    return True
+
+class MergeLease:
+    """
+    合并期间在后台线程中定期为合并租约续约
+
+    合并上千页可能超过租约时长，不续约的话任务会被重新放回队列，由另一个进程同时合并。
+    后台线程使用自己的数据库连接；续约失败（租约已被判定过期）后 is_owner() 返回False。
+    """
+
+    def __init__(self, db_path, job_id, worker_id, lease_seconds):
+        self.db_path = db_path
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self._lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        work_queue = WorkQueue(self.db_path, lease_seconds=self.lease_seconds)
+        try:
+            while not self._stop.wait(self.lease_seconds / 3):
+                if not work_queue.renew_merge(self.job_id, self.worker_id):
+                    self._lost.set()
+                    break
+        finally:
+            work_queue.close()
+
+    def is_owner(self):
+        return not self._lost.is_set()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+
+def merge_job(job, items, worker_id, is_owner=lambda: True):
+    """
+    按页码顺序合并所有分片，写入最终输出文件并清理分片
+
+    临时文件名带上工作进程ID；每合并一个分片以及替换输出、删除分片之前都检查合并租约，
+    租约丢失时放弃合并，不动输出文件和分片。
+
+    Returns:
+        是否完成合并
+    """
+    pdf_writer = PdfWriter()
+    for item in items:
+        if not is_owner():
+            return False
+        pdf_writer.append(item["part_path"])
+
+    output_path = job["output_path"]
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    temp_path = f"{output_path}.{worker_id}.part"
+    try:
+        with open(temp_path, "wb") as output_file:
+            pdf_writer.write(output_file)
+        if not is_owner():
+            os.remove(temp_path)
+            return False
+        os.replace(temp_path, output_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    shutil.rmtree(parts_dir_for(output_path), ignore_errors=True)
+    return True
+
+def run_worker(db_path, worker_id=None, lease_seconds=300, poll_interval=2.0,
+               exit_when_idle=True, stop_event=None):
+    """
+    工作进程主循环：领取分片处理，所有分片完成的任务由完成最后一个分片的进程合并
+
+    Args:
+        db_path: 队列数据库路径
+        worker_id: 工作进程标识，默认为 主机名-进程号
+        lease_seconds: 租约时长
+        poll_interval: 队列暂时为空时的轮询间隔（秒）
+        exit_when_idle: 队列中没有未完成的任务时退出
+        stop_event: 被设置后处理完当前分片即退出（用于减少工作进程）
+
+    Returns:
+        本进程处理完成的分片数
+    """
+    worker_id = worker_id or default_worker_id()
+    work_queue = WorkQueue(db_path, lease_seconds=lease_seconds)
+    processed = 0
+    try:
+        while not (stop_event and stop_event.is_set()):
+            item = work_queue.claim(worker_id)
+            if item is not None:
+                if process_item(work_queue, item, worker_id):
+                    processed += 1
+                continue
+
+            work_queue.mark_failed_jobs()
+            merge = work_queue.claim_merge(worker_id)
+            if merge is not None:
+                job, items = merge
+                try:
+                    with MergeLease(db_path, job["id"], worker_id, lease_seconds) as lease:
+                        merged = merge_job(job, items, worker_id, lease.is_owner)
+                    if merged:
+                        work_queue.finish_job(job["id"], worker_id)
+                    else:
+                        print(f"合并租约已过期，放弃合并 {job['output_path']}")
+                except Exception as e:
+                    print(f"合并失败 {job['output_path']}: {e}")
+                    work_queue.finish_job(job["id"], worker_id, status="failed")
+                continue
+
+            if exit_when_idle and not work_queue.has_unfinished_work():
+                break
+            time.sleep(poll_interval)
+    finally:
+        work_queue.close()
+    return processed
+
+def run_local_workers(db_path, processes, lease_seconds=300):
+    """在本机启动多个工作进程，等待全部退出"""
+    workers = [
+        multiprocessing.Process(target=run_worker, args=(db_path,),
+                                kwargs={"lease_seconds": lease_seconds})
+        for _ in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+def run_governed_workers(db_path, governor, lease_seconds=300, interval=2.0,
+                         exit_when_idle=True):
+    """
+    在本机启动工作进程，进程数由 ConcurrencyGovernor 按内存、CPU和待处理分片数调整
+
+    每个工作进程同一时间只处理一页，因此进程数即为同时处理的页数。减少进程时通知多余的进程
+    处理完当前分片后退出，不会中断正在处理的分片。
+
+    Args:
+        db_path: 队列数据库路径
+        governor: governor.ConcurrencyGovernor
+        lease_seconds: 租约时长
+        interval: 调节间隔（秒）
+        exit_when_idle: 队列中没有未完成的任务时退出
+    """
+    work_queue = WorkQueue(db_path, lease_seconds=lease_seconds)
+    workers = []   # [(进程, 停止事件)]
+    try:
+        while True:
+            workers = [(worker, stop) for worker, stop in workers if worker.is_alive()]
+            pending = work_queue.pending_count()
+            unfinished = work_queue.has_unfinished_work()
+            if exit_when_idle and not workers and not unfinished:
+                break
+
+            running = [(worker, stop) for worker, stop in workers if not stop.is_set()]
+            governor.update(queue_depth=pending, active_workers=len(running),
+                            pids=[worker.pid for worker, _ in workers])
+
+            if pending:
+                target = governor.target_workers
+            elif unfinished and not running:
+                # 没有待领取的分片但还有任务未合并（或租约到期后会重新放回队列），至少保留一个进程
+                target = 1
+            else:
+                target = len(running)
+            while len(running) < target:
+                stop = multiprocessing.Event()
+                worker = multiprocessing.Process(
+                    target=run_worker, args=(db_path,),
+                    kwargs={"lease_seconds": lease_seconds, "stop_event": stop,
+                            "exit_when_idle": exit_when_idle}
+                )
+                worker.start()
+                workers.append((worker, stop))
+                running.append((worker, stop))
+            for worker, stop in running[governor.target_workers:]:
+                stop.set()
+
+            time.sleep(interval)
+    finally:
+        work_queue.close()
+        for worker, _ in workers:
+            worker.join()
+
+def main():
+    parser = argparse.ArgumentParser(description="基于SQLite工作队列的分片处理")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    enqueue_parser = subparsers.add_parser("enqueue", help="把PDF文件切片入队")
+    enqueue_parser.add_argument("db", help="队列数据库路径")
+    enqueue_parser.add_argument("pdfs", nargs="+", help="输入PDF文件")
+    enqueue_parser.add_argument("--output-dir", required=True, help="输出目录")
+    enqueue_parser.add_argument("--chunk-pages", type=int, default=50, help="每个分片的页数")
+
+    worker_parser = subparsers.add_parser("worker", help="启动工作进程")
+    worker_parser.add_argument("db", help="队列数据库路径")
+    worker_parser.add_argument("--processes", type=int, default=1, help="本机启动的工作进程数")
+    worker_parser.add_argument("--lease", type=float, default=300, help="租约时长（秒）")
+    worker_parser.add_argument("--keep-running", action="store_true",
+                               help="队列为空时继续等待新任务")
+    worker_parser.add_argument("--max-processes", type=int, default=None,
+                               help="按资源占用自动调整进程数，--processes 为下限，该值为上限")
+    worker_parser.add_argument("--memory-limit", type=int, default=None,
+                               help="自动调整时的内存上限（MB）")
+    worker_parser.add_argument("--metrics", default=None,
+                               help="自动调整时把调节决策以 JSON Lines 写入该文件")
+
+    status_parser = subparsers.add_parser("status", help="查看队列状态")
+    status_parser.add_argument("db", help="队列数据库路径")
+
+    args = parser.parse_args()
+
+    if args.command == "enqueue":
+        work_queue = WorkQueue(args.db)
+        for input_pdf in args.pdfs:
+            base_name = os.path.splitext(os.path.basename(input_pdf))[0]
+            output_path = os.path.join(args.output_dir, f"{base_name}_processed.pdf")
+            job_id = work_queue.enqueue_file(input_pdf, output_path, args.chunk_pages)
+            print(f"已入队 #{job_id}: {input_pdf} -> {output_path}")
+        work_queue.close()
+    elif args.command == "worker":
+        if args.max_processes:
+            governor = ConcurrencyGovernor(
+                min_workers=args.processes, max_workers=args.max_processes,
+                memory_limit_mb=args.memory_limit, metrics_path=args.metrics,
+            )
+            run_governed_workers(args.db, governor, args.lease,
+                                 exit_when_idle=not args.keep_running)
+            print("并行调节：" + json.dumps(governor.metrics(), ensure_ascii=False))
+        elif args.processes > 1:
+            run_local_workers(args.db, args.processes, args.lease)
+        else:
+            run_worker(args.db, lease_seconds=args.lease,
+                       exit_when_idle=not args.keep_running)
+    elif args.command == "status":
+        work_queue = WorkQueue(args.db)
+        for job in work_queue.status():
+            print(f"#{job['id']} [{job['status']}] {job['input_pdf']} ({job['total_pages']} 页): "
+                  f"完成 {job['done']}/{job['total']}，处理中 {job['leased']}，"
+                  f"等待 {job['pending']}，失败 {job['failed']}")
+        work_queue.close()
+
+if __name__ == "__main__":
+    main()
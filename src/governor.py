@@ -0,0 +1,291 @@
+"""
+资源感知的并发调节
+
+固定的并行数两头都不合适：大页面以 100 DPI 渲染时几个并行就可能超出容器内存，
+而小回执单又让CPU大量空闲。ConcurrencyGovernor 周期性地观察内存（RSS）、CPU 和队列深度，
+在配置的范围内调整两个量：
+
+- 工作线程/进程数（target_workers）：变化较慢，每次调整后有冷却时间
+- 同时处于渲染+检测阶段的页数（page_gate）：内存吃紧时立即收紧，处理线程在下一页开始前就会等待
+
+每次调整都会记录为一条决策，metrics() 返回当前状态和累计统计；指定 metrics_path 时
+每条非"维持"的决策还会以 JSON Lines 追加写入该文件，便于接入日志或监控。
+
+安装了 psutil 时统计整个进程树的内存和系统CPU占用；未安装时在 Linux 上读取 /proc
+（按 /proc/*/stat 中的父进程号找出所有子孙进程，如 pdftoppm），
+其它平台上内存不可知（不做内存限制），CPU 用系统负载估计。
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, asdict
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def proc_descendants(pid):
+    """从 /proc 中找出 pid 的所有子孙进程（仅 Linux），读取失败的进程忽略"""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # 第2个字段是括号中的进程名，可能包含空格和括号，父进程号在最后一个右括号之后
+        fields = stat[stat.rfind(")") + 2:].split()
+        if len(fields) > 1:
+            children.setdefault(int(fields[1]), []).append(int(entry))
+
+    descendants = []
+    pending = [pid]
+    while pending:
+        for child in children.get(pending.pop(), []):
+            descendants.append(child)
+            pending.append(child)
+    return descendants
+
+
+class ResourceSampler:
+    """采集进程树内存和系统CPU占用"""
+
+    def __init__(self):
+        self.cpu_count = os.cpu_count() or 1
+        if psutil:
+            self.process = psutil.Process()
+            # 第一次调用只是建立基准
+            psutil.cpu_percent(None)
+
+    def rss_bytes(self, pids=()):
+        """当前进程（含子进程）和额外指定进程的常驻内存之和；无法获取时返回None"""
+        if psutil:
+            total = 0
+            processes = [self.process] + self.process.children(recursive=True)
+            seen = {p.pid for p in processes}
+            for process in processes:
+                try:
+                    total += process.memory_info().rss
+                except psutil.Error:
+                    pass
+            for pid in pids:
+                if pid in seen:
+                    continue
+                try:
+                    total += psutil.Process(pid).memory_info().rss
+                except psutil.Error:
+                    pass
+            return total
+
+        if os.path.exists("/proc/self/statm"):
+            total = 0
+            page_size = os.sysconf("SC_PAGE_SIZE")
+            for pid in {os.getpid(), *proc_descendants(os.getpid()), *pids}:
+                try:
+                    with open(f"/proc/{pid}/statm") as f:
+                        total += int(f.read().split()[1]) * page_size
+                except OSError:
+                    pass
+            return total
+        return None
+
+    def cpu_fraction(self):
+        """系统CPU占用（0~1），为自上次调用以来的平均值；无法获取时返回None"""
+        if psutil:
+            return psutil.cpu_percent(None) / 100
+        if hasattr(os, "getloadavg"):
+            return min(1.0, os.getloadavg()[0] / self.cpu_count)
+        return None
+
+
+class AdjustableSemaphore:
+    """上限可以随时调整的信号量，调低上限时已经持有的不受影响，只是不再发放新的"""
+
+    def __init__(self, limit):
+        self._limit = limit
+        self._in_use = 0
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self):
+        return self._limit
+
+    @property
+    def in_use(self):
+        return self._in_use
+
+    def set_limit(self, limit):
+        with self._condition:
+            self._limit = limit
+            self._condition.notify_all()
+
+    def acquire(self):
+        with self._condition:
+            while self._in_use >= self._limit:
+                self._condition.wait()
+            self._in_use += 1
+
+    def release(self):
+        with self._condition:
+            self._in_use -= 1
+            self._condition.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+
+@dataclass(frozen=True)
+class GovernorDecision:
+    """一次调节决策"""
+    timestamp: float
+    action: str          # "scale_up" / "scale_down" / "throttle" / "release" / "hold"
+    reason: str
+    workers: int
+    inflight_pages: int
+    active_workers: int
+    queue_depth: int
+    rss_mb: float = None
+    cpu: float = None
+
+
+class ConcurrencyGovernor:
+    """
+    根据资源占用调整并行度
+
+    调用方按固定间隔调用 update()，然后把活动的工作线程/进程数调整到 target_workers；
+    页面处理代码在渲染+检测前后获取/释放 page_gate。
+
+    Args:
+        min_workers: 最少工作数
+        max_workers: 最多工作数，默认CPU核数
+        memory_limit_mb: 内存上限（MB），为None时不限制
+        target_cpu: CPU占用低于该值且队列中还有任务时增加工作数
+        max_inflight_pages: 同时渲染+检测的页数上限，默认与工作数相同
+        cooldown: 两次调整工作数之间的最小间隔（秒）
+        sampler: 资源采集器，默认为 ResourceSampler
+        clock: 时间函数
+        history: 内存中保留的最近决策条数
+        metrics_path: 决策日志文件（JSON Lines），为None时不写
+    """
+
+    # 内存占用达到上限的该比例时收紧，低于 RELAX 比例时才重新放开
+    MEMORY_HIGH = 0.9
+    MEMORY_RELAX = 0.75
+
+    def __init__(self, min_workers=1, max_workers=None, memory_limit_mb=None, target_cpu=0.85,
+                 max_inflight_pages=None, cooldown=3.0, sampler=None, clock=time.monotonic,
+                 history=200, metrics_path=None):
+        self.min_workers = max(1, min_workers)
+        self.max_workers = max(self.min_workers, max_workers or os.cpu_count() or 1)
+        self.memory_limit = memory_limit_mb * 1024 * 1024 if memory_limit_mb else None
+        self.target_cpu = target_cpu
+        self.max_inflight_pages = max_inflight_pages
+        self.cooldown = cooldown
+        self.sampler = sampler or ResourceSampler()
+        self.clock = clock
+
+        self.target_workers = min(self.max_workers, max(self.min_workers, 2))
+        self.page_gate = AdjustableSemaphore(self._cap_inflight(self.target_workers))
+        self.last_scale = None
+        self.decisions = deque(maxlen=history)
+        self.counters = {"scale_up": 0, "scale_down": 0, "throttle": 0, "release": 0, "hold": 0}
+        self.peak_rss = 0
+        self.last_decision = None
+        self.metrics_path = metrics_path
+
+    def _cap_inflight(self, value):
+        if self.max_inflight_pages:
+            value = min(value, self.max_inflight_pages)
+        return max(1, value)
+
+    def _can_scale(self, now):
+        return self.last_scale is None or now - self.last_scale >= self.cooldown
+
+    def update(self, queue_depth, active_workers, pids=()):
+        """
+        采样并做出一次调节决策
+
+        Args:
+            queue_depth: 等待处理的任务数
+            active_workers: 当前正在运行的工作数
+            pids: 需要一并统计内存的工作进程ID（子进程会自动统计）
+
+        Returns:
+            GovernorDecision
+        """
+        now = self.clock()
+        rss = self.sampler.rss_bytes(pids)
+        cpu = self.sampler.cpu_fraction()
+        if rss:
+            self.peak_rss = max(self.peak_rss, rss)
+        inflight = self.page_gate.limit
+        action, reason = "hold", ""
+
+        memory_ratio = rss / self.memory_limit if rss is not None and self.memory_limit else None
+
+        if memory_ratio is not None and memory_ratio >= self.MEMORY_HIGH:
+            # 内存吃紧：先立即减少同时处理的页数，工作数在冷却后再减
+            if inflight > 1:
+                inflight -= 1
+                action, reason = "throttle", "内存接近上限，减少同时处理的页数"
+            if self._can_scale(now) and self.target_workers > self.min_workers:
+                self.target_workers -= 1
+                self.last_scale = now
+                action, reason = "scale_down", "内存接近上限"
+        elif memory_ratio is not None and memory_ratio >= self.MEMORY_RELAX:
+            reason = "内存偏高，暂不增加并行"
+        else:
+            if inflight < self._cap_inflight(self.target_workers):
+                inflight += 1
+                action, reason = "release", "内存恢复，放开同时处理的页数"
+            elif (cpu is not None and cpu < self.target_cpu and queue_depth > 0
+                  and active_workers >= self.target_workers
+                  and self.target_workers < self.max_workers and self._can_scale(now)):
+                self.target_workers += 1
+                self.last_scale = now
+                inflight = self._cap_inflight(self.target_workers)
+                action, reason = "scale_up", "CPU空闲且队列中还有任务"
+
+        if inflight != self.page_gate.limit:
+            self.page_gate.set_limit(inflight)
+
+        decision = GovernorDecision(
+            time.time(), action, reason, self.target_workers, inflight, active_workers,
+            queue_depth, round(rss / 1024 / 1024, 1) if rss is not None else None,
+            round(cpu, 3) if cpu is not None else None,
+        )
+        self.counters[action] += 1
+        # 连续的"维持"只保留第一条
+        if action != "hold" or not self.decisions or self.decisions[-1].action != "hold":
+            self.decisions.append(decision)
+        if self.metrics_path and action != "hold":
+            with open(self.metrics_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(asdict(decision), ensure_ascii=False) + "\n")
+        self.last_decision = decision
+        return decision
+
+    def metrics(self):
+        """当前状态和累计统计"""
+        last = self.last_decision
+        return {
+            "target_workers": self.target_workers,
+            "inflight_pages_limit": self.page_gate.limit,
+            "inflight_pages": self.page_gate.in_use,
+            "min_workers": self.min_workers,
+            "max_workers": self.max_workers,
+            "memory_limit_mb": self.memory_limit / 1024 / 1024 if self.memory_limit else None,
+            "peak_rss_mb": round(self.peak_rss / 1024 / 1024, 1),
+            "counters": dict(self.counters),
+            "last_decision": asdict(last) if last else None,
+        }
@@ -0,0 +1,202 @@
+"""
+输出PDF的体积与写入优化
+
+每个回执单都是原始页面的一个带裁剪框的副本，默认写出时会带着各自的一份内容流和资源，
+输出文件可能比实际需要大好几倍。这里提供可按次选择的优化步骤：
+
+- dedupe：合并完全相同的对象（字体、图像、内容流等），删除不再被引用的对象
+- remove_unused_resources：删除页面资源字典中内容流没有用到的字体、图像和图形状态
+- recompress_streams：用 Flate 重新压缩内容流
+- object_streams：把对象打包成对象流并使用交叉引用流（需要安装 pikepdf，未安装时跳过）
+
+预设：
+    none  不做任何优化（与原来的输出完全相同）
+    fast  只合并相同对象，代价很小
+    max   全部步骤
+"""
+import io
+import os
+import time
+from dataclasses import dataclass, replace
+
+from pypdf.generic import DictionaryObject, NameObject
+
+
+@dataclass(frozen=True)
+class OutputOptions:
+    """输出优化选项"""
+    dedupe: bool = False
+    remove_unused_resources: bool = False
+    recompress_streams: bool = False
+    compression_level: int = 6
+    object_streams: bool = False
+    # 额外把未优化的结果写入内存，用于报告优化前后的体积对比（会多花一次序列化的时间）
+    measure_baseline: bool = False
+
+    def replace(self, **changes):
+        return replace(self, **changes)
+
+
+PRESETS = {
+    "none": OutputOptions(),
+    "fast": OutputOptions(dedupe=True),
+    "max": OutputOptions(dedupe=True, remove_unused_resources=True,
+                         recompress_streams=True, object_streams=True),
+}
+
+# 内容流中引用各类资源的操作符
+_RESOURCE_OPERATORS = {
+    b"Do": "/XObject",
+    b"Tf": "/Font",
+    b"gs": "/ExtGState",
+}
+
+
+def used_resource_names(page):
+    """解析页面内容流，返回 {资源类别: 用到的名称集合}"""
+    used = {category: set() for category in _RESOURCE_OPERATORS.values()}
+    contents = page.get_contents()
+    if contents is None:
+        return used
+    for operands, operator in contents.operations:
+        category = _RESOURCE_OPERATORS.get(operator)
+        if category and operands:
+            used[category].add(operands[0])
+    return used
+
+def remove_unused_resources(page):
+    """
+    删除页面资源字典中没有被内容流引用的字体、图像和图形状态
+
+    资源字典经常被多个页面共享，因此不在原字典上修改，而是给页面换上一个精简后的副本
+    （相同的副本随后会被 dedupe 合并）。
+
+    Returns:
+        删除的资源条目数
+    """
+    resources = page.get("/Resources")
+    if resources is None:
+        return 0
+    resources = resources.get_object()
+    used = used_resource_names(page)
+
+    removed = 0
+    pruned = DictionaryObject()
+    for key, value in resources.items():
+        if key not in used:
+            pruned[NameObject(key)] = value
+            continue
+        entries = value.get_object()
+        kept = DictionaryObject()
+        for name, entry in entries.items():
+            if name in used[key]:
+                kept[NameObject(name)] = entry
+            else:
+                removed += 1
+        pruned[NameObject(key)] = kept
+
+    if removed:
+        page[NameObject("/Resources")] = pruned
+    return removed
+
+def _serialized_size(pdf_writer):
+    buffer = io.BytesIO()
+    pdf_writer.write(buffer)
+    return buffer.tell()
+
+def optimize_writer(pdf_writer, options):
+    """
+    在写出之前对 PdfWriter 做优化
+
+    Returns:
+        报告字典：各步骤耗时、删除的资源数
+    """
+    report = {}
+    if options.remove_unused_resources:
+        start = time.perf_counter()
+        report["removed_resources"] = sum(remove_unused_resources(page) for page in pdf_writer.pages)
+        report["remove_unused_resources_seconds"] = time.perf_counter() - start
+
+    if options.recompress_streams:
+        start = time.perf_counter()
+        for page in pdf_writer.pages:
+            page.compress_content_streams(level=options.compression_level)
+        report["recompress_seconds"] = time.perf_counter() - start
+
+    # 放在最后：前面的步骤会产生新的（往往彼此相同的）资源字典和内容流
+    if options.dedupe:
+        start = time.perf_counter()
+        pdf_writer.compress_identical_objects()
+        report["dedupe_seconds"] = time.perf_counter() - start
+    return report
+
+def rewrite_with_object_streams(path, recompress):
+    """
+    用 pikepdf 重写文件，生成对象流和交叉引用流
+
+    Returns:
+        是否成功（未安装 pikepdf 时返回False）
+    """
+    try:
+        import pikepdf
+    except ImportError:
+        return False
+
+    temp_path = path + ".objstm"
+    try:
+        with pikepdf.open(path) as pdf:
+            pdf.save(temp_path, object_stream_mode=pikepdf.ObjectStreamMode.generate,
+                     compress_streams=True, recompress_flate=recompress)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return True
+
+def write_pdf(pdf_writer, path, options=None):
+    """
+    按选项优化并写出PDF
+
+    Args:
+        pdf_writer: PdfWriter
+        path: 输出文件路径
+        options: OutputOptions 或预设名称，为None时不做优化
+
+    Returns:
+        报告字典：输出字节数、总耗时、各步骤耗时，measure_baseline 时还有未优化的字节数
+    """
+    if options is None:
+        options = PRESETS["none"]
+    elif isinstance(options, str):
+        options = PRESETS[options]
+
+    start = time.perf_counter()
+    report = {}
+    if options.measure_baseline:
+        report["baseline_bytes"] = _serialized_size(pdf_writer)
+        start = time.perf_counter()
+
+    report.update(optimize_writer(pdf_writer, options))
+
+    with open(path, "wb") as output_file:
+        pdf_writer.write(output_file)
+
+    if options.object_streams:
+        object_stream_start = time.perf_counter()
+        report["object_streams"] = rewrite_with_object_streams(path, options.recompress_streams)
+        report["object_streams_seconds"] = time.perf_counter() - object_stream_start
+
+    report["output_bytes"] = os.path.getsize(path)
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+def format_report(report):
+    """把优化报告格式化为一行中文说明"""
+    text = f"输出 {report['output_bytes'] / 1024:.1f} KB，写出耗时 {report['seconds']:.2f} 秒"
+    if "baseline_bytes" in report and report["baseline_bytes"]:
+        ratio = report["output_bytes"] / report["baseline_bytes"]
+        text += f"（未优化 {report['baseline_bytes'] / 1024:.1f} KB，为其 {ratio:.0%}）"
+    if report.get("object_streams") is False:
+        text += "；未安装 pikepdf，已跳过对象流"
+    return text
@@ -0,0 +1,179 @@
+"""
+按需加载PDF页面
+
+PdfReader(路径) 会把整个文件读入内存，而 len(reader.pages) 和 reader.pages[i] 会展开整棵
+页面树、为每一页创建页面对象。对于几千页、几百MB的对账单，这些工作在开始检测之前就要花掉
+大量时间和内存，即使只需要处理其中几页。
+
+LazyPageTree 保持文件打开、按交叉引用表按需读取对象，页数直接取页面树根节点的 /Count，
+取第 i 页时沿 /Kids 按各子树的 /Count 向下查找，只解析途经的节点，并把可继承的属性
+（/Resources、/MediaBox、/CropBox、/Rotate）补到页面上，与 pypdf 展开后的页面对象一致。
+每个节点已解析过的子节点及其页数前缀和会被记住（见 KidIndex），按顺序取完整个文件的
+总开销与页数成线性关系。页面树的 /Count 与实际不符（损坏的文件）时退回到 pypdf 的完整展开。
+"""
+from bisect import bisect_right
+
+from pypdf import PageObject, PdfReader
+from pypdf.generic import IndirectObject, NameObject
+
+
+# 可以从上级页面树节点继承的页面属性
+INHERITABLE_ATTRIBUTES = ("/Resources", "/MediaBox", "/CropBox", "/Rotate")
+
+# 页面树的最大深度，防止损坏的文件中出现循环引用
+MAX_TREE_DEPTH = 64
+
+
+class KidIndex:
+    """
+    一个 /Pages 节点的子节点索引
+
+    子节点只在第一次需要时按顺序解析，同时记下每个子节点第一页在该节点内的序号，
+    之后的查找在这些前缀和上二分，不再从头扫描 /Kids。
+    """
+
+    def __init__(self, node):
+        self.node = node
+        self.kids = node.get("/Kids", [])
+        self.starts = []    # 已解析的子节点各自第一页的序号
+        self.resolved = []  # 已解析的 (子节点引用, 子节点)
+        self.end = 0        # 已解析的子节点共包含的页数
+
+    def find(self, offset):
+        """
+        查找该节点内第 offset 页所在的子节点
+
+        Returns:
+            (子节点引用, 子节点, 子节点第一页的序号)，子节点不够（/Count 与实际不符）时返回None
+        """
+        while self.end <= offset and len(self.resolved) < len(self.kids):
+            kid_ref = self.kids[len(self.resolved)]
+            kid = kid_ref.get_object()
+            self.starts.append(self.end)
+            self.resolved.append((kid_ref, kid))
+            self.end += int(kid.get("/Count", 0)) if "/Kids" in kid else 1
+        if offset >= self.end:
+            return None
+
+        # /Count 为0的子树与下一个子节点起点相同，bisect_right 会跳过它们
+        i = bisect_right(self.starts, offset) - 1
+        kid_ref, kid = self.resolved[i]
+        return kid_ref, kid, self.starts[i]
+
+
+class LazyPageTree:
+    """
+    按需解析页面的只读PDF
+
+    同一页多次获取返回同一个页面对象（与 reader.pages[i] 的行为一致）。用完后需要 close()，
+    也可以作为上下文管理器使用。
+    """
+
+    def __init__(self, input_pdf):
+        self.file = open(input_pdf, "rb")
+        try:
+            self.reader = PdfReader(self.file)
+            self.root = self.reader.root_object["/Pages"].get_object()
+            count = self.root.get("/Count")
+            self.page_count = int(count) if count is not None else len(self.reader.pages)
+        except BaseException:
+            self.file.close()
+            raise
+        self._pages = {}
+        self._kid_indexes = {}  # id(节点) -> KidIndex
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def __len__(self):
+        return self.page_count
+
+    def get_page(self, page_num):
+        """获取第 page_num 页（从0开始）的页面对象"""
+        page = self._pages.get(page_num)
+        if page is not None:
+            return page
+        if not 0 <= page_num < self.page_count:
+            raise IndexError(f"页码超出范围: {page_num + 1}（共 {self.page_count} 页）")
+
+        page = self._find_page(page_num)
+        if page is None:
+            page = self.reader.pages[page_num]
+        self._pages[page_num] = page
+        return page
+
+    def _find_page(self, page_num):
+        """沿页面树向下查找，找不到（树结构与 /Count 不符）时返回None"""
+        node = self.root
+        inherited = {}
+        remaining = page_num
+        for _ in range(MAX_TREE_DEPTH):
+            for attr in INHERITABLE_ATTRIBUTES:
+                if attr in node:
+                    inherited[attr] = node[attr]
+
+            found = self._kid_index(node).find(remaining)
+            if found is None:
+                return None
+            kid_ref, kid, start = found
+            if "/Kids" not in kid:
+                return self._make_page(kid, kid_ref, inherited)
+            node = kid
+            remaining -= start
+        return None
+
+    def _kid_index(self, node):
+        # KidIndex 持有节点本身，id 在 LazyPageTree 的生命周期内不会被复用
+        index = self._kid_indexes.get(id(node))
+        if index is None:
+            index = self._kid_indexes[id(node)] = KidIndex(node)
+        return index
+
+    def _make_page(self, node, ref, inherited):
+        page = PageObject(self.reader, ref if isinstance(ref, IndirectObject) else None)
+        page.update(node)
+        # 页面自己的属性优先于继承的属性
+        for attr, value in inherited.items():
+            if attr not in page:
+                page[NameObject(attr)] = value
+        return page
+
+
+def parse_page_ranges(spec, page_count):
+    """
+    解析页码范围
+
+    Args:
+        spec: 如 "1-10,20,30-"，页码从1开始，范围包含两端，"30-" 表示第30页到最后一页
+        page_count: 文件总页数
+
+    Returns:
+        从0开始的页码列表，按页码排序并去重
+    """
+    pages = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            if "-" in part:
+                start, end = part.split("-", 1)
+                start = int(start) if start.strip() else 1
+                end = int(end) if end.strip() else page_count
+            else:
+                start = end = int(part)
+        except ValueError:
+            raise ValueError(f"无法解析页码范围: {part}")
+        if start < 1 or end < start:
+            raise ValueError(f"无效的页码范围: {part}")
+        if start > page_count:
+            raise ValueError(f"页码超出范围: {part}（共 {page_count} 页）")
+        pages.update(range(start - 1, min(end, page_count)))
+    return sorted(pages)
@@ -1,10 +1,39 @@
 import sys
 import os
 import time
+import heapq
+import itertools
+import queue
+import shutil
+import tempfile
 
-from PySide6.QtWidgets import (QApplication, QMainWindow, QPushButton, QFileDialog, QVBoxLayout, QHBoxLayout, QWidget, QLabel, QProgressBar)
-from PySide6.QtCore import Qt, QThread, Signal
+from PySide6.QtWidgets import (QApplication, QMainWindow, QPushButton, QFileDialog, QVBoxLayout, QHBoxLayout, QWidget, QLabel, QProgressBar,
+                               QListWidget, QListWidgetItem, QListView)
+from PySide6.QtCore import Qt, QThread, Signal, QSize, QPoint, QTimer
+from PySide6.QtGui import QImage, QPixmap, QIcon
 
+from thumbnail_cache import LRUCache
+from governor import ConcurrencyGovernor
+
+
+# 队列优先级：数值越小越先处理
+PRIORITY_URGENT = 0
+PRIORITY_NORMAL = 1
+
+# 进度刷新间隔（秒）
+PROGRESS_REFRESH_INTERVAL = 0.1
+
+# 缩略图预览：最长边像素数，以及内存中缓存的缩略图总大小上限
+THUMBNAIL_SIZE = 160
+THUMBNAIL_CACHE_BYTES = 64 * 1024 * 1024
+
+# 输出优化预设："none" / "fast" / "max"，见 output_optimizer.py
+OUTPUT_OPTIMIZATION = "fast"
+
+# 并行处理：同时处理的文件数由 governor.ConcurrencyGovernor 按内存和CPU占用在范围内调整
+MAX_PARALLEL_FILES = None  # None 表示CPU核数
+MEMORY_LIMIT_MB = None  # None 表示不限制内存
+GOVERNOR_INTERVAL_MS = 1000
 
 def import_pdf_processor():
     """延迟导入 PDF 处理模块"""
@@ -58,34 +87,101 @@ def setup_poppler_path():
     # print(f"pdftoppm 路径: {pdftoppm_path}")
 
 class PDFProcessThread(QThread):
-    progress = Signal(int, str)  # 进度信号：(进度值, 描述文本)
+    progress = Signal(object)  # 进度信号：progress.ProgressEvent（已在处理线程中合并限速）
     finished = Signal(bool, str)  # 完成信号：(是否成功, 消息)
+    cancelled = Signal()  # 取消信号：处理被用户取消
+    thumbnail = Signal(str, str)  # 缩略图信号：(缩略图文件路径, 描述文本)
 
-    def __init__(self, input_pdf, output_path):
+    def __init__(self, input_pdf, output_path, thumbnail_dir=None, thumbnail_prefix="",
+                 page_gate=None):
         super().__init__()
         self.input_pdf = input_pdf
         self.output_path = output_path
+        # 与其它并行的处理线程共享的页面名额
+        self.page_gate = page_gate
+        # 缩略图写入该目录后只把路径发给界面线程，由界面按需加载
+        self.thumbnail_dir = thumbnail_dir
+        self.thumbnail_prefix = thumbnail_prefix
+        # 开始处理时才导入处理模块，不影响程序启动速度
+        from split_pdf_opencv import ProcessingControl
+        self.control = ProcessingControl()
+
+    def pause(self):
+        self.control.pause()
+
+    def resume(self):
+        self.control.resume()
+
+    def cancel(self):
+        self.control.cancel()
 
     def run(self):
         try:
             # 在实际需要时才导入处理模块
             process_pdf_with_opencv = import_pdf_processor()
+            from split_pdf_opencv import ProcessingCancelled
+            import cv2
             
-            # 定义进度回调函数
-            def progress_callback(value, text):
-                self.progress.emit(value, text)
+            base_name = os.path.basename(self.input_pdf)
             
-            # 处理PDF文件
+            def thumbnail_callback(thumb):
+                path = os.path.join(
+                    self.thumbnail_dir, f"{self.thumbnail_prefix}{thumb.output_index:06d}.png"
+                )
+                cv2.imwrite(path, thumb.image)
+                self.thumbnail.emit(
+                    path, f"{base_name} 第 {thumb.page_num + 1} 页 第 {thumb.receipt_index + 1} 个回执单"
+                )
+            
+            # 处理PDF文件，进度事件按界面刷新频率合并后才跨线程发送
             process_pdf_with_opencv(
                 self.input_pdf,
                 self.output_path,
-                progress_callback=progress_callback
+                progress_event_callback=self.progress.emit,
+                control=self.control,
+                progress_interval=PROGRESS_REFRESH_INTERVAL,
+                thumbnail_callback=thumbnail_callback if self.thumbnail_dir else None,
+                thumbnail_size=THUMBNAIL_SIZE,
+                output_options=OUTPUT_OPTIMIZATION,
+                page_gate=self.page_gate
             )
             
             self.finished.emit(True, "处理完成！")
+        except ProcessingCancelled:
+            self.cancelled.emit()
         except Exception as e:
             self.finished.emit(False, f"处理失败: {str(e)}")
 
+class ThumbnailLoader(QThread):
+    """后台加载缩略图文件，界面线程只负责把加载好的图像显示出来"""
+    loaded = Signal(str, QImage)  # (缩略图文件路径, 图像)
+
+    def __init__(self):
+        super().__init__()
+        self.requests = queue.Queue()
+        self.pending = set()
+
+    def request(self, path):
+        """请求加载缩略图，重复的请求会被忽略"""
+        if path in self.pending:
+            return
+        self.pending.add(path)
+        self.requests.put(path)
+
+    def stop(self):
+        self.requests.put(None)
+        self.wait()
+
+    def run(self):
+        while True:
+            path = self.requests.get()
+            if path is None:
+                break
+            image = QImage(path)
+            self.pending.discard(path)
+            if not image.isNull():
+                self.loaded.emit(path, image)
+
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -138,16 +234,67 @@ class MainWindow(QMainWindow):
         self.status_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         layout.addWidget(self.status_label)
         
+        # 回执单缩略图预览：只为可见区域加载图像，图像缓存在大小受限的LRU缓存中
+        self.preview_list = QListWidget()
+        self.preview_list.setViewMode(QListView.ViewMode.IconMode)
+        self.preview_list.setIconSize(QSize(THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        self.preview_list.setResizeMode(QListView.ResizeMode.Adjust)
+        self.preview_list.setUniformItemSizes(True)
+        self.preview_list.setMovement(QListView.Movement.Static)
+        self.preview_list.verticalScrollBar().valueChanged.connect(self.schedule_thumbnail_refresh)
+        layout.addWidget(self.preview_list, 1)
+        
+        self.thumbnail_cache = LRUCache(THUMBNAIL_CACHE_BYTES)
+        self.thumbnail_dir = tempfile.mkdtemp(prefix="receipt_thumbs_")
+        self.thumbnail_rows = {}  # 缩略图文件路径 -> 列表行号
+        self.iconed_rows = set()  # 当前设置了图标的行
+        self.thumbnail_loader = ThumbnailLoader()
+        self.thumbnail_loader.loaded.connect(self.on_thumbnail_loaded)
+        self.thumbnail_loader.start()
+        
+        # 滚动和新增缩略图时合并刷新，避免频繁遍历
+        self.thumbnail_refresh_timer = QTimer(self)
+        self.thumbnail_refresh_timer.setSingleShot(True)
+        self.thumbnail_refresh_timer.setInterval(50)
+        self.thumbnail_refresh_timer.timeout.connect(self.refresh_visible_thumbnails)
+        
         # 处理按钮
         self.process_btn = QPushButton("开始处理")
         self.process_btn.clicked.connect(self.start_processing)
         self.process_btn.setEnabled(False)
         layout.addWidget(self.process_btn)
         
+        # 处理控制按钮：暂停/继续、取消、加急
+        control_layout = QHBoxLayout()
+        self.pause_btn = QPushButton("暂停")
+        self.pause_btn.clicked.connect(self.toggle_pause)
+        self.cancel_btn = QPushButton("取消")
+        self.cancel_btn.clicked.connect(self.cancel_processing)
+        self.urgent_btn = QPushButton("加急处理文件")
+        self.urgent_btn.clicked.connect(self.add_urgent_files)
+        for btn in (self.pause_btn, self.cancel_btn, self.urgent_btn):
+            btn.setEnabled(False)
+            control_layout.addWidget(btn)
+        layout.addLayout(control_layout)
+        
         # 初始化变量
         self.input_pdfs = []  # 存储多个PDF文件路径
         self.output_dir = None
         self.is_processing = False
+        self.is_paused = False
+        self.cancel_requested = False
+        # 待处理队列：(优先级, 序号, 文件路径)，同优先级按加入顺序处理
+        self.pending_queue = []
+        self.queue_counter = itertools.count()
+        self.processed_count = 0
+        self.total_count = 0
+        # 正在处理的文件：序号 -> 处理线程，以及各自的进度百分比
+        self.threads = {}
+        self.file_progress = {}
+        self.governor = None
+        self.governor_timer = QTimer(self)
+        self.governor_timer.setInterval(GOVERNOR_INTERVAL_MS)
+        self.governor_timer.timeout.connect(self.adjust_parallelism)
         
     def select_input_files(self):
         if self.is_processing:
@@ -209,66 +356,264 @@ class MainWindow(QMainWindow):
             
         # 设置处理中状态
         self.is_processing = True
+        self.is_paused = False
+        self.cancel_requested = False
         self.process_btn.setEnabled(False)
         self.select_file_btn.setEnabled(False)
         self.select_folder_btn.setEnabled(False)
         self.select_output_btn.setEnabled(False)
+        self.pause_btn.setText("暂停")
+        for btn in (self.pause_btn, self.cancel_btn, self.urgent_btn):
+            btn.setEnabled(True)
         self.status_label.setStyleSheet("")
         
+        # 清空上一批的缩略图预览
+        self.clear_thumbnails()
+        
         # 开始处理所有PDF文件
-        self.current_pdf_index = 0
+        self.pending_queue = []
+        self.processed_count = 0
+        self.total_count = 0
+        self.file_progress = {}
+        for input_pdf in self.input_pdfs:
+            self.enqueue_pdf(input_pdf, PRIORITY_NORMAL)
+        self.governor = ConcurrencyGovernor(max_workers=MAX_PARALLEL_FILES,
+                                            memory_limit_mb=MEMORY_LIMIT_MB)
+        self.governor_timer.start()
+        self.process_next_pdf()
+        
+    def enqueue_pdf(self, input_pdf, priority):
+        heapq.heappush(self.pending_queue, (priority, next(self.queue_counter), input_pdf))
+        self.total_count += 1
+        
+    def add_urgent_files(self):
+        """处理过程中加入加急文件，它们会在当前文件完成后优先处理"""
+        if not self.is_processing:
+            return
+            
+        files, _ = QFileDialog.getOpenFileNames(
+            self, "选择加急处理的PDF文件", "", "PDF文件 (*.pdf)"
+        )
+        for input_pdf in files:
+            self.enqueue_pdf(input_pdf, PRIORITY_URGENT)
+        if files:
+            self.status_label.setText(f"已加入 {len(files)} 个加急文件，将在正在处理的文件完成后优先处理")
+        
+    def toggle_pause(self):
+        if not self.is_processing:
+            return
+            
+        self.is_paused = not self.is_paused
+        if self.is_paused:
+            for thread in self.threads.values():
+                thread.pause()
+            self.pause_btn.setText("继续")
+            self.status_label.setText("已暂停（当前页处理完成后暂停）")
+        else:
+            for thread in self.threads.values():
+                thread.resume()
+            self.pause_btn.setText("暂停")
+            self.status_label.setText("继续处理")
+        
+    def cancel_processing(self):
+        """取消正在处理的文件并清空待处理队列"""
+        if not self.is_processing:
+            return
+            
+        self.cancel_requested = True
+        self.pending_queue = []
+        self.pause_btn.setEnabled(False)
+        self.cancel_btn.setEnabled(False)
+        self.urgent_btn.setEnabled(False)
+        self.status_label.setText("正在取消...")
+        for thread in self.threads.values():
+            thread.cancel()
+        
+    def adjust_parallelism(self):
+        """定时让调节器根据资源占用做一次决策，并按需启动更多文件"""
+        decision = self.governor.update(queue_depth=len(self.pending_queue),
+                                        active_workers=len(self.threads))
+        if decision.reason:
+            self.progress_bar.setToolTip(
+                f"并行 {decision.workers} 个文件，同时处理 {decision.inflight_pages} 页：{decision.reason}"
+            )
         self.process_next_pdf()
         
     def process_next_pdf(self):
-        if self.current_pdf_index >= len(self.input_pdfs):
+        """按调节器给出的并行数启动待处理的文件"""
+        while self.pending_queue and len(self.threads) < self.governor.target_workers:
+            self.start_pdf(*heapq.heappop(self.pending_queue))
+            
+        if not self.threads and not self.pending_queue:
             # 所有文件处理完成
             self.on_all_files_processed()
-            return
             
-        input_pdf = self.input_pdfs[self.current_pdf_index]
+    def start_pdf(self, priority, seq, input_pdf):
         base_name = os.path.splitext(os.path.basename(input_pdf))[0]
         output_path = os.path.join(self.output_dir, f"{base_name}_processed.pdf")
         
-        self.status_label.setText(f"正在处理第 {self.current_pdf_index + 1}/{len(self.input_pdfs)} 个文件: {base_name}")
+        self.status_label.setText(f"开始处理第 {self.processed_count + len(self.threads) + 1}/{self.total_count} 个文件: {base_name}")
+        
+        # 创建处理线程，信号带上文件序号以区分并行的线程
+        thread = PDFProcessThread(input_pdf, output_path, self.thumbnail_dir,
+                                  f"{seq:04d}_", self.governor.page_gate)
+        thread.thumbnail.connect(self.add_thumbnail)
+        thread.progress.connect(lambda event, seq=seq: self.update_progress(seq, event))
+        thread.finished.connect(
+            lambda success, message, seq=seq: self.on_single_file_processed(seq, success, message)
+        )
+        thread.cancelled.connect(lambda seq=seq: self.on_file_cancelled(seq))
+        if self.is_paused:
+            thread.pause()
+        self.threads[seq] = thread
+        self.file_progress[seq] = 0
+        thread.start()
         
-        # 创建处理线程
-        self.thread = PDFProcessThread(input_pdf, output_path)
-        self.thread.progress.connect(self.update_progress)
-        self.thread.finished.connect(self.on_single_file_processed)
-        self.thread.start()
+    def release_thread(self, seq):
+        thread = self.threads.pop(seq)
+        self.file_progress.pop(seq, None)
+        # 信号在 run() 返回前发出，等线程真正结束再释放对象
+        thread.wait()
         
-    def update_progress(self, value, text):
-        """更新进度条和状态文本"""
+    def update_progress(self, seq, event):
+        """根据进度事件更新进度条和状态文本"""
+        if seq not in self.threads:
+            return
+        self.file_progress[seq] = event.percent
         # 计算总体进度
-        file_progress = value / len(self.input_pdfs)
-        total_progress = (self.current_pdf_index * 100 + file_progress) / len(self.input_pdfs)
+        total_progress = (self.processed_count * 100 + sum(self.file_progress.values())) / self.total_count
         self.progress_bar.setValue(int(total_progress))
-        self.status_label.setText(f"文件 {self.current_pdf_index + 1}/{len(self.input_pdfs)}: {text}")
+        self.status_label.setText(
+            f"已完成 {self.processed_count}/{self.total_count}，并行 {len(self.threads)} 个文件: {event.message}"
+        )
         
-    def on_single_file_processed(self, success, message):
+    def on_single_file_processed(self, seq, success, message):
+        self.release_thread(seq)
         if not success:
             self.status_label.setText(f"处理文件失败: {message}")
             self.status_label.setStyleSheet("color: red")
             # 继续处理下一个文件
         
-        self.current_pdf_index += 1
+        self.processed_count += 1
+        if self.cancel_requested:
+            # 取消请求到达前该文件已经处理完成，等其它文件取消后再结束
+            if not self.threads:
+                self.on_processing_cancelled()
+            return
         self.process_next_pdf()
         
-    def on_all_files_processed(self):
+    def on_file_cancelled(self, seq):
+        self.release_thread(seq)
+        if not self.threads:
+            self.on_processing_cancelled()
+        
+    def on_processing_cancelled(self):
+        self.pending_queue = []
+        self.finish_processing()
+        self.status_label.setText(f"已取消，已完成 {self.processed_count}/{self.total_count} 个文件")
+        self.status_label.setStyleSheet("color: orange")
+        
+    def finish_processing(self):
+        self.governor_timer.stop()
+        
         # 恢复按钮状态
         self.is_processing = False
+        self.is_paused = False
         self.select_file_btn.setEnabled(True)
         self.select_folder_btn.setEnabled(True)
         self.select_output_btn.setEnabled(True)
+        self.pause_btn.setText("暂停")
+        for btn in (self.pause_btn, self.cancel_btn, self.urgent_btn):
+            btn.setEnabled(False)
+        
+        # 重置文件选择
+        self.input_pdfs = []
+        self.file_label.setText("请选择新的PDF文件或文件夹")
+        
+    def on_all_files_processed(self):
+        self.finish_processing()
         
         # 更新状态显示
-        self.status_label.setText(f"所有 {len(self.input_pdfs)} 个文件处理完成！")
+        self.status_label.setText(f"所有 {self.total_count} 个文件处理完成！")
         self.status_label.setStyleSheet("color: green")
         self.progress_bar.setValue(100)
+
+    def add_thumbnail(self, path, text):
+        item = QListWidgetItem(text.split(" ", 1)[-1])
+        item.setToolTip(text)
+        item.setSizeHint(QSize(THUMBNAIL_SIZE + 20, THUMBNAIL_SIZE + 40))
+        self.thumbnail_rows[path] = self.preview_list.count()
+        item.setData(Qt.ItemDataRole.UserRole, path)
+        self.preview_list.addItem(item)
+        self.schedule_thumbnail_refresh()
         
-        # 重置文件选择
-        self.input_pdfs = []
-        self.file_label.setText("请选择新的PDF文件或文件夹")
+    def schedule_thumbnail_refresh(self):
+        if not self.thumbnail_refresh_timer.isActive():
+            self.thumbnail_refresh_timer.start()
+        
+    def visible_thumbnail_rows(self):
+        """返回当前可见的行号范围（IconMode下行号按显示顺序排列）"""
+        count = self.preview_list.count()
+        if count == 0:
+            return range(0)
+        viewport = self.preview_list.viewport().rect()
+        first = self.preview_list.indexAt(viewport.topLeft() + QPoint(2, 2)).row()
+        last = self.preview_list.indexAt(viewport.bottomRight() - QPoint(2, 2)).row()
+        if last < 0:
+            # 右下角没有条目时可能是最后一行没排满，再看左下角
+            last = self.preview_list.indexAt(QPoint(2, viewport.bottom() - 2)).row()
+        first = 0 if first < 0 else first
+        last = count - 1 if last < 0 else last
+        return range(first, last + 1)
+        
+    def refresh_visible_thumbnails(self):
+        """为可见的条目设置图标，并释放不可见条目的图标"""
+        visible = set(self.visible_thumbnail_rows())
+        
+        for row in self.iconed_rows - visible:
+            item = self.preview_list.item(row)
+            if item:
+                item.setIcon(QIcon())
+        self.iconed_rows &= visible
+        
+        for row in visible - self.iconed_rows:
+            item = self.preview_list.item(row)
+            if item is None:
+                continue
+            path = item.data(Qt.ItemDataRole.UserRole)
+            pixmap = self.thumbnail_cache.get(path)
+            if pixmap is None:
+                self.thumbnail_loader.request(path)
+            else:
+                item.setIcon(QIcon(pixmap))
+                self.iconed_rows.add(row)
+        
+    def on_thumbnail_loaded(self, path, image):
+        pixmap = QPixmap.fromImage(image)
+        self.thumbnail_cache.put(path, pixmap, image.sizeInBytes())
+        row = self.thumbnail_rows.get(path)
+        if row is not None and row in set(self.visible_thumbnail_rows()):
+            self.preview_list.item(row).setIcon(QIcon(pixmap))
+            self.iconed_rows.add(row)
+        
+    def clear_thumbnails(self):
+        self.preview_list.clear()
+        self.thumbnail_rows = {}
+        self.iconed_rows = set()
+        self.thumbnail_cache.clear()
+        shutil.rmtree(self.thumbnail_dir, ignore_errors=True)
+        os.makedirs(self.thumbnail_dir, exist_ok=True)
+        
+    def closeEvent(self, event):
+        if self.is_processing:
+            self.governor_timer.stop()
+            for thread in self.threads.values():
+                thread.cancel()
+            for thread in self.threads.values():
+                thread.wait()
+        self.thumbnail_loader.stop()
+        shutil.rmtree(self.thumbnail_dir, ignore_errors=True)
+        super().closeEvent(event)
 
 def main():
     # print(f"[{time.time()}] 开始设置环境...")
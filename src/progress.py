@@ -0,0 +1,139 @@
+"""
+进度上报
+
+处理流程只更新结构化的进度状态（页数、回执单数、字节数），
+由 ProgressTracker 合并这些更新并按固定频率向外发送，避免每页、每个回执单
+都格式化字符串并跨线程发送信号；同时根据已处理的页数计算吞吐量和剩余时间。
+"""
+import time
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class ProgressEvent:
+    """某一时刻的进度快照"""
+    stage: str              # "start" / "page" / "saving" / "done"
+    percent: int
+    pages_done: int
+    total_pages: int
+    receipts: int
+    bytes_processed: int    # 已处理页面内容流的字节数
+    elapsed: float          # 秒
+    pages_per_sec: float
+    eta: float = None       # 预计剩余秒数，尚无法估计时为None
+    detail: str = ""        # 阶段相关的附加信息（文件路径等）
+
+    @property
+    def message(self):
+        """格式化为界面显示的状态文本（只在真正需要显示时才格式化）"""
+        if self.stage == "start":
+            return f"正在处理PDF: {self.detail}，总页数: {self.total_pages}"
+        if self.stage == "saving":
+            return f"正在保存: {self.detail}"
+        if self.stage == "done":
+            return f"已保存合并后的PDF文件: {self.detail}"
+
+        text = (f"正在处理第 {min(self.pages_done + 1, self.total_pages)}/{self.total_pages} 页，"
+                f"已找到 {self.receipts} 个回执单")
+        if self.pages_per_sec > 0:
+            text += f"，{self.pages_per_sec:.1f} 页/秒"
+        if self.eta is not None:
+            text += f"，剩余约 {format_duration(self.eta)}"
+        return text
+
+
+def format_duration(seconds):
+    """将秒数格式化为简短的中文时长"""
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds} 秒"
+    minutes, seconds = divmod(seconds, 60)
+    if minutes < 60:
+        return f"{minutes} 分 {seconds} 秒"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours} 小时 {minutes} 分"
+
+
+class ProgressTracker:
+    """
+    合并并限速的进度上报器
+
+    page_done() 只更新计数，距上次发送超过 interval 秒时才真正调用回调；
+    start()/saving()/finish() 总是立即发送。
+
+    Args:
+        progress_callback: 旧式回调，接收 (进度百分比, 状态描述)
+        event_callback: 接收 ProgressEvent 的回调
+        interval: 两次发送之间的最小间隔（秒），即界面刷新频率的倒数
+        clock: 时间函数，默认为 time.monotonic
+    """
+
+    def __init__(self, progress_callback=None, event_callback=None, interval=0.1,
+                 clock=time.monotonic):
+        self.progress_callback = progress_callback
+        self.event_callback = event_callback
+        self.interval = interval
+        self.clock = clock
+
+        self.total_pages = 0
+        self.pages_done = 0
+        self.receipts = 0
+        self.bytes_processed = 0
+        self.started_at = None
+        self.last_emit = None
+
+    @property
+    def enabled(self):
+        return self.progress_callback is not None or self.event_callback is not None
+
+    def start(self, total_pages, detail=""):
+        self.total_pages = total_pages
+        self.pages_done = 0
+        self.receipts = 0
+        self.bytes_processed = 0
+        self.started_at = self.clock()
+        self._emit("start", detail)
+
+    def page_done(self, receipts=0, bytes_processed=0):
+        """记录一页处理完成，按限速决定是否发送"""
+        self.pages_done += 1
+        self.receipts += receipts
+        self.bytes_processed += bytes_processed
+        if self.enabled and self.clock() - self.last_emit >= self.interval:
+            self._emit("page")
+
+    def saving(self, detail=""):
+        self._emit("saving", detail)
+
+    def finish(self, detail=""):
+        self._emit("done", detail)
+
+    def snapshot(self, stage="page", detail=""):
+        """生成当前进度的 ProgressEvent"""
+        elapsed = self.clock() - self.started_at
+        pages_per_sec = self.pages_done / elapsed if elapsed > 0 else 0.0
+        remaining = self.total_pages - self.pages_done
+        eta = remaining / pages_per_sec if pages_per_sec > 0 else None
+
+        if stage == "start":
+            percent = 0
+        elif stage == "done":
+            percent = 100
+        elif self.total_pages:
+            percent = int((self.pages_done / self.total_pages) * 98) + 1
+        else:
+            percent = 99
+
+        return ProgressEvent(stage, percent, self.pages_done, self.total_pages,
+                             self.receipts, self.bytes_processed, elapsed,
+                             pages_per_sec, eta, detail)
+
+    def _emit(self, stage, detail=""):
+        self.last_emit = self.clock()
+        if not self.enabled:
+            return
+        event = self.snapshot(stage, detail)
+        if self.event_callback:
+            self.event_callback(event)
+        if self.progress_callback:
+            self.progress_callback(event.percent, event.message)
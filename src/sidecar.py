@@ -0,0 +1,121 @@
+"""
+回执单位置索引（sidecar）
+
+处理过程中把每个输出回执单的来源和几何信息流式写入一个旁路文件，下游工具可以直接按
+来源文件/页码或输出页码查找，并据此重新裁剪，不需要重新运行检测。支持两种格式：
+
+- JSON Lines（.jsonl）：每个回执单一行紧凑的JSON
+- SQLite（.db / .sqlite / .sqlite3）：receipts 表，按来源页和输出页码建了索引
+
+每条记录的字段：
+    source          来源PDF的绝对路径
+    page            来源页码（从0开始）
+    receipt_index   该页中的第几个回执单（从0开始）
+    kind            "split"（分割）/ "single"（整页）/ "fast_single"（快速通道判定的整页）/
+                    "duplicate_page"（整页已在去重索引中，没有检测，下面的几何字段为null）
+    output_path     输出PDF的绝对路径
+    output_index    在输出PDF中的页码（从0开始），重复而未输出的回执单为null
+    duplicate_of    去重索引中已有记录的ID，非重复时为null
+    dpi             检测图像的分辨率
+    image_size      检测图像的像素尺寸 [宽, 高]
+    box_px          像素坐标 [x, y, w, h]，原点在左上角
+    page_size       PDF页面尺寸 [宽, 高]（点）
+    box_pdf         PDF坐标 [x, y, w, h]，原点在左下角（即输出页面的裁剪框）
+    detect_ms       该页检测耗时（毫秒）
+
+文件先写入 .part 临时文件，输出PDF成功保存后才改名为正式文件名。
+"""
+import json
+import os
+import sqlite3
+
+
+class JsonlSidecar:
+    """JSON Lines 格式的位置索引"""
+
+    def __init__(self, path):
+        self.path = path
+        self.temp_path = path + ".part"
+        self.file = open(self.temp_path, "w", encoding="utf-8")
+
+    def write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+        self.file.write("\n")
+
+    def commit(self):
+        self.file.close()
+        os.replace(self.temp_path, self.path)
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+class SqliteSidecar:
+    """SQLite 格式的位置索引，记录按批写入"""
+
+    BATCH_SIZE = 500
+
+    def __init__(self, path):
+        self.path = path
+        self.temp_path = path + ".part"
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+        self.conn = sqlite3.connect(self.temp_path)
+        self.conn.execute(
+            "CREATE TABLE receipts (source TEXT, page INTEGER, receipt_index INTEGER, kind TEXT, "
+            "output_path TEXT, output_index INTEGER, duplicate_of INTEGER, dpi INTEGER, "
+            "image_width INTEGER, image_height INTEGER, "
+            "px_x INTEGER, px_y INTEGER, px_w INTEGER, px_h INTEGER, "
+            "page_width REAL, page_height REAL, "
+            "pdf_x REAL, pdf_y REAL, pdf_w REAL, pdf_h REAL, detect_ms REAL)"
+        )
+        self.pending = []
+
+    def write(self, record):
+        self.pending.append((
+            record["source"], record["page"], record["receipt_index"], record["kind"],
+            record["output_path"], record["output_index"], record["duplicate_of"], record["dpi"],
+            *(record["image_size"] or (None, None)), *(record["box_px"] or (None,) * 4),
+            *record["page_size"], *(record["box_pdf"] or (None,) * 4),
+            record["detect_ms"],
+        ))
+        if len(self.pending) >= self.BATCH_SIZE:
+            self._flush()
+
+    def _flush(self):
+        self.conn.executemany(
+            "INSERT INTO receipts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            self.pending
+        )
+        self.pending = []
+
+    def commit(self):
+        self._flush()
+        # 索引在全部写入后再建，比边插入边维护快
+        self.conn.execute("CREATE INDEX receipts_by_source ON receipts(source, page, receipt_index)")
+        self.conn.execute("CREATE INDEX receipts_by_output ON receipts(output_path, output_index)")
+        self.conn.commit()
+        self.conn.close()
+        os.replace(self.temp_path, self.path)
+
+    def abort(self):
+        self.conn.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+def open_sidecar(path):
+    """根据扩展名创建位置索引写入器"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in (".jsonl", ".db", ".sqlite", ".sqlite3"):
+        raise ValueError(f"不支持的位置索引格式: {path}（支持 .jsonl / .db / .sqlite / .sqlite3）")
+
+    sidecar_dir = os.path.dirname(path)
+    if sidecar_dir:
+        os.makedirs(sidecar_dir, exist_ok=True)
+
+    if ext == ".jsonl":
+        return JsonlSidecar(path)
+    return SqliteSidecar(path)
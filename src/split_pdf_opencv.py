@@ -3,14 +3,202 @@ import cv2
 import numpy as np
 from PIL import Image
 import os
-from pypdf import PdfWriter, PdfReader
+import argparse
+from contextlib import nullcontext
+from dataclasses import dataclass, field, asdict, replace
+from pypdf import PdfWriter
+from pypdf.generic import ArrayObject
 import sys
+import tempfile
+import threading
+import time
 
+from progress import ProgressTracker
+from dedup_index import DedupIndex, page_content_hash, perceptual_hash, detail_signature
+from sidecar import open_sidecar
+from output_optimizer import PRESETS, write_pdf, format_report
+from page_loader import LazyPageTree, parse_page_ranges
 
-def find_content_boundaries(gray_img):
+
+@dataclass(frozen=True)
+class DetectionConfig:
+    """
+    回执单检测参数
+
+    所有检测相关的常量集中在这里，默认值与原先写死在代码中的数值一致。
+    对象不可变，相同的配置总是得到相同的检测结果，可以安全地在进程间传递。
+    """
+    # 检测用的渲染分辨率
+    dpi: int = 100
+    # 自适应阈值参数
+    adaptive_block_size: int = 25
+    adaptive_c: int = 15
+    # 形态学操作参数
+    kernel_size: int = 5
+    dilate_iterations: int = 2
+    erode_iterations: int = 1
+    # 轮廓过滤：最小面积占整页的比例，以及高度占整页高度的范围
+    min_area_ratio: float = 0.05
+    min_height_ratio: float = 0.05
+    max_height_ratio: float = 0.6
+    # 唯一区域覆盖页面高度超过该比例时保留整页
+    full_page_coverage: float = 0.7
+    # 裁剪区域上下的动态边距比例
+    margin_ratio: float = 0.08
+    # find_content_boundaries 的内容阈值比例和额外边距（像素）
+    boundary_threshold_ratio: float = 0.01
+    boundary_padding: int = 15
+    # 快速预分类：缩略图中灰度低于 thumbnail_ink_threshold 的像素视为墨迹；
+    # 内容段的平均墨迹密度超过 thumbnail_max_ink_density 时（深色底色、有色纸张）不做快速判定
+    quick_skip: bool = True
+    thumbnail_dpi: int = 20
+    thumbnail_ink_threshold: int = 200
+    thumbnail_ink_ratio: float = 0.01
+    thumbnail_coverage: float = 0.85
+    thumbnail_max_ink_density: float = 0.5
+    # 分块检测：页面高宽比超过 tile_max_aspect 时（如整卷扫描的热敏小票）按水平条带渲染和分析，
+    # 条带高度和相邻条带的重叠均为检测分辨率下的像素数
+    tile_max_aspect: float = 3.0
+    tile_height_px: int = 2048
+    tile_overlap_px: int = 128
+    # 分块检测下的过滤与合并阈值，均相对于页面宽度（这种页面的高度没有参考意义）
+    tile_min_width_ratio: float = 0.3
+    tile_min_height_ratio: float = 0.1
+    tile_merge_gap_ratio: float = 0.03
+
+    def __post_init__(self):
+        """检查取值范围，避免非法参数到了 OpenCV 内部才报错"""
+        if self.dpi <= 0 or self.thumbnail_dpi <= 0:
+            raise ValueError("dpi 和 thumbnail_dpi 必须大于0")
+        if self.adaptive_block_size <= 1 or self.adaptive_block_size % 2 == 0:
+            raise ValueError(f"adaptive_block_size 必须是大于1的奇数: {self.adaptive_block_size}")
+        if self.kernel_size < 1:
+            raise ValueError(f"kernel_size 必须大于0: {self.kernel_size}")
+        if self.dilate_iterations < 0 or self.erode_iterations < 0:
+            raise ValueError("dilate_iterations 和 erode_iterations 不能为负数")
+        if self.boundary_padding < 0:
+            raise ValueError(f"boundary_padding 不能为负数: {self.boundary_padding}")
+        if not 0 <= self.thumbnail_ink_threshold <= 255:
+            raise ValueError(f"thumbnail_ink_threshold 必须在 0~255 之间: {self.thumbnail_ink_threshold}")
+        for name in ("min_area_ratio", "min_height_ratio", "max_height_ratio", "full_page_coverage",
+                     "margin_ratio", "boundary_threshold_ratio", "thumbnail_ink_ratio",
+                     "thumbnail_coverage", "thumbnail_max_ink_density", "tile_min_width_ratio",
+                     "tile_min_height_ratio", "tile_merge_gap_ratio"):
+            if not 0 <= getattr(self, name) <= 1:
+                raise ValueError(f"{name} 必须在 0~1 之间: {getattr(self, name)}")
+        if self.min_height_ratio > self.max_height_ratio:
+            raise ValueError("min_height_ratio 不能大于 max_height_ratio")
+        if self.tile_max_aspect <= 0:
+            raise ValueError(f"tile_max_aspect 必须大于0: {self.tile_max_aspect}")
+        if not 0 <= self.tile_overlap_px < self.tile_height_px:
+            raise ValueError("tile_overlap_px 必须不小于0且小于 tile_height_px")
+
+    def to_dict(self):
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        """从字典创建配置，忽略未知的键"""
+        known = cls.__dataclass_fields__.keys()
+        return cls(**{k: v for k, v in data.items() if k in known})
+
+    def replace(self, **changes):
+        return replace(self, **changes)
+
+
+DEFAULT_CONFIG = DetectionConfig()
+
+
+class ProcessingCancelled(Exception):
+    """处理被用户取消"""
+
+
+class ProcessingControl:
+    """
+    协作式的取消/暂停控制
+
+    由界面线程调用 cancel()/pause()/resume()，处理线程在页与页之间调用 checkpoint()：
+    暂停时在 checkpoint() 中阻塞，取消时抛出 ProcessingCancelled。
+    """
+
+    def __init__(self):
+        self._cancelled = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+
+    def cancel(self):
+        self._cancelled.set()
+        # 唤醒处于暂停状态的处理线程，让它尽快退出
+        self._running.set()
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    @property
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def is_paused(self):
+        return not self._running.is_set()
+
+    def checkpoint(self):
+        self._running.wait()
+        if self._cancelled.is_set():
+            raise ProcessingCancelled()
+
+
+@dataclass
+class ReceiptBox:
+    """检测到的单个回执单区域，同时保存像素坐标和PDF坐标"""
+    y: int        # 图像坐标，从顶部开始
+    h: int
+    pdf_y: float  # PDF坐标，从底部开始
+    pdf_h: float
+
+
+@dataclass
+class PageAnalysis:
+    """
+    单页的检测结果
+
+    kind 取值：
+    - "blank": 空白页，丢弃
+    - "fast_single": 快速预分类判定为单张回执单，原样保留
+    - "single": 完整检测后判定为单张回执单，原样保留
+    - "split": 需要按 boxes 分割
+
+    image_size 和 dpi 描述检测时使用的图像（快速通道下为缩略图），boxes 的像素坐标基于该图像；
+    gray 是该图像的灰度图，分块检测时为了控制内存只保留缩小后的版本
+    """
+    kind: str
+    boxes: list = field(default_factory=list)
+    image_size: tuple = None
+    gray: np.ndarray = None
+    dpi: int = None
+
+
+@dataclass
+class CropThumbnail:
+    """交给调用方的回执单缩略图"""
+    page_num: int        # 原始页码（从0开始）
+    receipt_index: int   # 该页中的第几个回执单（从0开始）
+    output_index: int    # 在输出PDF中的页码（从0开始）
+    image: np.ndarray    # 缩小后的灰度图
+
+
+def find_content_boundaries(gray_img, threshold_ratio=0.01, padding=15):
     """
     分析图像内容来确定实际的内容边界
     返回内容的上下左右边界位置
+
+    Args:
+        gray_img: 灰度图像
+        threshold_ratio: 水平投影超过最大值的该比例即视为有内容
+        padding: 在内容上下额外保留的像素
     """
     # 使用Otsu's二值化方法
     _, binary = cv2.threshold(gray_img, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
@@ -19,7 +207,7 @@ def find_content_boundaries(gray_img):
     h_proj = np.sum(binary, axis=1)
     
     # 设置阈值，用于判断是否为内容
-    h_threshold = np.max(h_proj) * 0.01
+    h_threshold = np.max(h_proj) * threshold_ratio
     
     # 查找内容边界
     height = gray_img.shape[0]
@@ -29,18 +217,546 @@ def find_content_boundaries(gray_img):
     # 从上往下找到第一个有内容的行
     for i in range(height):
         if h_proj[i] > h_threshold:
-            top = max(0, i - 15)  # 增加额外空间
+            top = max(0, i - padding)  # 增加额外空间
             break
             
     # 从下往上找到最后一个有内容的行
     for i in range(height - 1, -1, -1):
         if h_proj[i] > h_threshold:
-            bottom = min(height - 1, i + 15)
+            bottom = min(height - 1, i + padding)
             break
             
     return top, bottom
 
-def process_pdf_with_opencv(input_pdf, output_path, progress_callback=None):
+def render_page_range(input_pdf, first_page, last_page, dpi, grayscale=False, use_cropbox=False):
+    """
+    用一次 pdftoppm 调用把连续的多页渲染为PIL图像列表
+
+    Args:
+        input_pdf: 输入PDF文件路径
+        first_page: 第一页页码（从0开始）
+        last_page: 最后一页页码（从0开始，包含）
+        dpi: 渲染分辨率
+        grayscale: 是否直接渲染为灰度图
+        use_cropbox: 只渲染裁剪框内的区域
+    """
+    if sys.platform == "darwin":
+        return convert_from_path(input_pdf, dpi=dpi, first_page=first_page+1,
+                                 last_page=last_page+1, grayscale=grayscale,
+                                 use_cropbox=use_cropbox, poppler_path="/opt/homebrew/bin")
+    return convert_from_path(input_pdf, dpi=dpi, first_page=first_page+1,
+                             last_page=last_page+1, grayscale=grayscale,
+                             use_cropbox=use_cropbox)
+
+def render_page(input_pdf, page_num, dpi, grayscale=False, use_cropbox=False):
+    """
+    将PDF的单个页面渲染为PIL图像
+
+    Args:
+        input_pdf: 输入PDF文件路径
+        page_num: 页码（从0开始）
+        dpi: 渲染分辨率
+        grayscale: 是否直接渲染为灰度图
+        use_cropbox: 只渲染裁剪框内的区域
+    """
+    return render_page_range(input_pdf, page_num, page_num, dpi, grayscale, use_cropbox)[0]
+
+
+class PageRenderer:
+    """
+    按处理顺序批量渲染页面
+
+    逐页调用 pdftoppm 时，每一页都要重新启动进程、重新打开和解析输入文件。PageRenderer 知道
+    接下来要处理哪些页，请求某一页时顺带渲染其后页码连续的几页，一次调用完成。
+
+    批量大小按分辨率分别从1页开始，上一批的图像全部被用到时翻倍，直到 max_batch；
+    有图像没被用到（例如这些页走了快速通道，不需要完整渲染）时退回1页。
+    处理过的页面的图像随即丢弃，内存占用只与批量大小有关。
+
+    预取的图像不受 page_gate 限制，因此有页面名额时应设置 max_prefetch_dpi，
+    只预取（极小的）缩略图，检测用的完整渲染逐页进行。
+
+    Args:
+        input_pdf: 输入PDF文件路径
+        page_numbers: 将要依次处理的页码（从0开始）
+        max_batch: 一次渲染的最大页数
+        can_prefetch: 判断某页能否被顺带渲染的函数，接收页码；例如细长页面按条带分块渲染，
+                      不能整页预取。为None时所有页面都可以
+        max_prefetch_dpi: 只有分辨率不超过该值的渲染才批量进行，为None时不限制
+    """
+
+    def __init__(self, input_pdf, page_numbers, max_batch=8, can_prefetch=None,
+                 max_prefetch_dpi=None):
+        self.input_pdf = input_pdf
+        self.order = list(page_numbers)
+        self.position = {page_num: i for i, page_num in enumerate(self.order)}
+        self.max_batch = max(1, max_batch)
+        self.can_prefetch = can_prefetch
+        self.max_prefetch_dpi = max_prefetch_dpi
+        self.cache = {}    # (dpi, 是否灰度) -> {页码: 图像}
+        self.batches = {}  # (dpi, 是否灰度) -> (上一批之后的位置, 上一批的页数, 是否有图像没被用到)
+        self.render_calls = 0
+
+    def render(self, page_num, dpi, grayscale=False):
+        """获取某一页的渲染结果，参数与 render_page 相同"""
+        position = self.position.get(page_num)
+        if position is None:
+            self.render_calls += 1
+            return render_page(self.input_pdf, page_num, dpi, grayscale)
+
+        key = (dpi, grayscale)
+        cache = self.cache.setdefault(key, {})
+        end, size, wasted = self.batches.get(key, (None, 0, False))
+        # 丢弃已经跳过的页面
+        for stale in [n for n in cache if self.position[n] < position]:
+            del cache[stale]
+            wasted = True
+
+        if page_num not in cache:
+            size = min(self.max_batch, size * 2) if end == position and not wasted else 1
+            if self.max_prefetch_dpi is not None and dpi > self.max_prefetch_dpi:
+                size = 1
+            run = [page_num]
+            for next_page in self.order[position + 1:position + size]:
+                if next_page != run[-1] + 1:
+                    break
+                if self.can_prefetch and not self.can_prefetch(next_page):
+                    break
+                run.append(next_page)
+            images = render_page_range(self.input_pdf, run[0], run[-1], dpi, grayscale)
+            self.render_calls += 1
+            cache.update(zip(run, images))
+            end, wasted = position + len(run), False
+
+        self.batches[key] = (end, size, wasted)
+        return cache.pop(page_num)
+
+def get_content_stream_size(page):
+    """
+    读取页面内容流的原始字节数（不解码），用于快速判断空白页
+    """
+    contents = page.get("/Contents")
+    if contents is None:
+        return 0
+    contents = contents.get_object()
+    if not isinstance(contents, ArrayObject):
+        contents = [contents]
+
+    size = 0
+    for stream in contents:
+        stream = stream.get_object()
+        length = stream.get("/Length")
+        if length is not None:
+            size += int(length.get_object())
+        else:
+            size += len(stream.get_data())
+    return size
+
+def has_xobjects(page):
+    """判断页面资源中是否包含图像等外部对象（扫描件的回执单通常是图像）"""
+    resources = page.get("/Resources")
+    if resources is None:
+        return False
+    xobjects = resources.get_object().get("/XObject")
+    return xobjects is not None and len(xobjects.get_object()) > 0
+
+def quick_classify_page(input_pdf, page_num, page, config=DEFAULT_CONFIG, renderer=None):
+    """
+    在完整检测流程之前对页面做快速预分类
+
+    先检查内容流大小（无需渲染），再用极低分辨率的缩略图做水平投影：
+    - 没有任何内容 -> "blank"，直接丢弃
+    - 只有一段连续内容且覆盖了大部分页面 -> "single"，原样保留
+    - 其它情况返回None，交给完整检测流程
+
+    灰色的扫描底色或有色纸张会让每一行都有"墨迹"，所以判定 "single" 还要求内容段的墨迹
+    密度不高；含图像的页面（扫描件）还要求缩略图四周确实留有空白，否则可能是底色上的多张回执单。
+
+    Returns:
+        (判定结果, 缩略图)，仅凭内容流判定为空白页时缩略图为None
+
+    Args:
+        input_pdf: 输入PDF文件路径
+        page_num: 页码（从0开始）
+        page: pypdf页面对象
+        config: 检测参数，使用其中的 thumbnail_* 参数
+        renderer: PageRenderer，为None时单独渲染这一页
+    """
+    if get_content_stream_size(page) == 0 and not has_xobjects(page):
+        return "blank", None
+
+    if renderer:
+        thumb = renderer.render(page_num, config.thumbnail_dpi, grayscale=True)
+    else:
+        thumb = render_page(input_pdf, page_num, config.thumbnail_dpi, grayscale=True)
+    thumb = np.array(thumb)
+    if thumb.ndim == 3:
+        thumb = cv2.cvtColor(thumb, cv2.COLOR_RGB2GRAY)
+
+    # 缩略图上的水平投影：每一行深色像素的占比
+    ink = thumb < config.thumbnail_ink_threshold
+    row_ratios = ink.mean(axis=1)
+    ink_rows = row_ratios > config.thumbnail_ink_ratio
+    if not ink_rows.any():
+        return "blank", thumb
+
+    # 内容行必须连续（中间没有空白行），否则可能存在多张回执单
+    rows = np.flatnonzero(ink_rows)
+    first, last = rows[0], rows[-1]
+    if not ink_rows[first:last + 1].all():
+        return None, thumb
+
+    if (last - first + 1) / thumb.shape[0] <= config.thumbnail_coverage:
+        return None, thumb
+    if ink[first:last + 1].mean() > config.thumbnail_max_ink_density:
+        return None, thumb
+    if has_xobjects(page):
+        col_ratios = ink.mean(axis=0)
+        borders = (row_ratios[0], row_ratios[-1], col_ratios[0], col_ratios[-1])
+        if max(borders) > config.thumbnail_ink_ratio:
+            return None, thumb
+    return "single", thumb
+
+def detect_receipt_regions(gray, config=DEFAULT_CONFIG):
+    """
+    在灰度图上检测回执单区域
+
+    Args:
+        gray: 页面灰度图
+        config: 检测参数
+
+    Returns:
+        (y, h) 像素区域列表，按从上到下排序；返回空列表表示应保留整页
+    """
+    img_height, img_width = gray.shape[:2]
+
+    # 使用自适应阈值处理
+    binary = cv2.adaptiveThreshold(
+        gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+        cv2.THRESH_BINARY_INV, config.adaptive_block_size, config.adaptive_c
+    )
+
+    # 进行形态学操作
+    kernel = np.ones((config.kernel_size, config.kernel_size), np.uint8)
+    dilated = cv2.dilate(binary, kernel, iterations=config.dilate_iterations)
+    eroded = cv2.erode(dilated, kernel, iterations=config.erode_iterations)
+
+    # 查找轮廓
+    contours, hierarchy = cv2.findContours(
+        eroded, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
+    )
+
+    # 调整最小区域面积的要求
+    min_area = img_width * img_height * config.min_area_ratio
+
+    # 过滤并排序轮廓（按垂直位置）
+    valid_contours = []
+    for cnt in contours:
+        area = cv2.contourArea(cnt)
+        if area > min_area:
+            x, y, w, h = cv2.boundingRect(cnt)
+            if config.min_height_ratio <= h / img_height <= config.max_height_ratio:
+                valid_contours.append((y, y + h))  # 只保存垂直位置
+
+    # 按y坐标排序
+    valid_contours.sort()
+
+    # 如果没有找到有效的分割区域，保留整页
+    if not valid_contours:
+        return []
+    elif len(valid_contours) == 1:
+        # 检查唯一的区域是否覆盖了大部分页面
+        y_start, y_end = valid_contours[0]
+        coverage = (y_end - y_start) / img_height
+        if coverage > config.full_page_coverage:
+            return []
+
+    regions = []
+    for y_start, y_end in valid_contours:
+        # 提取当前区域的灰度图像
+        roi_gray = gray[y_start:y_end, :]
+
+        # 分析内容边界（只分析垂直方向）
+        top, bottom = find_content_boundaries(
+            roi_gray, config.boundary_threshold_ratio, config.boundary_padding
+        )
+
+        # 计算最终的裁剪区域
+        final_y = y_start + top
+        final_h = bottom - top
+
+        # 添加动态边距
+        margin_vertical = int(final_h * config.margin_ratio)
+
+        final_y = max(0, final_y - margin_vertical)
+        final_h = min(img_height - final_y, final_h + 2 * margin_vertical)
+        regions.append((final_y, final_h))
+
+    return regions
+
+def is_tall_page(page, config=DEFAULT_CONFIG):
+    """页面是否细长到需要分块检测"""
+    return float(page.mediabox.height) > float(page.mediabox.width) * config.tile_max_aspect
+
+# 只读取页面对象、不需要渲染的页面筛选条件，参数为 (页面对象, 检测参数)
+PAGE_PREDICATES = {
+    "has-content": lambda page, config: get_content_stream_size(page) > 0 or has_xobjects(page),
+    "has-images": lambda page, config: has_xobjects(page),
+    "tall": is_tall_page,
+}
+
+def merge_intervals(intervals, max_gap):
+    """合并重叠或间距不超过 max_gap 的区间"""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start - merged[-1][1] <= max_gap:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(interval) for interval in merged]
+
+def detect_tall_page_regions(input_pdf, page_num, page, config=DEFAULT_CONFIG, thumbnail_width=160):
+    """
+    分块检测细长页面中的回执单区域
+
+    整页按 config.tile_height_px 高、相互重叠 config.tile_overlap_px 的水平条带逐条渲染，
+    任意时刻只有一条条带的图像在内存中。每条条带上找到的轮廓换算到整页坐标后，
+    按垂直区间合并（跨越条带接缝的轮廓在重叠部分相交，会被合并成一个区域），
+    内容边界则根据整页的一维水平投影确定。
+
+    Args:
+        input_pdf: 输入PDF文件路径
+        page_num: 页码（从0开始）
+        page: pypdf页面对象
+        config: 检测参数
+        thumbnail_width: 同时生成的整页缩小灰度图的宽度（用于缩略图）
+
+    Returns:
+        (区域列表, 整页像素尺寸, 缩小后的整页灰度图)，区域为 (y, h) 像素坐标
+    """
+    scale = config.dpi / 72
+    media = page.mediabox
+    img_width = int(round(float(media.width) * scale))
+    img_height = int(round(float(media.height) * scale))
+    thumb_scale = min(1.0, thumbnail_width / img_width)
+
+    step_px = config.tile_height_px - config.tile_overlap_px
+    band_starts = list(range(0, max(1, img_height - config.tile_overlap_px), step_px))
+
+    # 为每个条带生成一个裁剪框不同的页面副本，渲染时只栅格化裁剪框内的部分
+    band_writer = PdfWriter()
+    for start in band_starts:
+        end = min(img_height, start + config.tile_height_px)
+        band_page = band_writer.add_page(page)
+        band_page.cropbox.lower_left = (float(media.left), float(media.top) - end / scale)
+        band_page.cropbox.upper_right = (float(media.right), float(media.top) - start / scale)
+
+    profile = np.zeros(img_height, dtype=np.int64)
+    thumb_rows = []
+    intervals = []
+    kernel = np.ones((config.kernel_size, config.kernel_size), np.uint8)
+    min_width = img_width * config.tile_min_width_ratio
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        band_pdf = os.path.join(temp_dir, "bands.pdf")
+        with open(band_pdf, "wb") as f:
+            band_writer.write(f)
+        del band_writer
+
+        for band_index, start in enumerate(band_starts):
+            band = np.array(render_page(band_pdf, band_index, config.dpi,
+                                        grayscale=True, use_cropbox=True))
+            if band.ndim == 3:
+                band = cv2.cvtColor(band, cv2.COLOR_RGB2GRAY)
+            band = band[:img_height - start]
+
+            binary = cv2.adaptiveThreshold(
+                band, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                cv2.THRESH_BINARY_INV, config.adaptive_block_size, config.adaptive_c
+            )
+            dilated = cv2.dilate(binary, kernel, iterations=config.dilate_iterations)
+            eroded = cv2.erode(dilated, kernel, iterations=config.erode_iterations)
+            contours, _ = cv2.findContours(eroded, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            for cnt in contours:
+                x, y, w, h = cv2.boundingRect(cnt)
+                if w >= min_width:
+                    intervals.append((start + y, start + y + h))
+
+            # 重叠部分两条条带都会覆盖，取较大值而不是累加
+            rows = np.count_nonzero(binary, axis=1)
+            segment = profile[start:start + len(rows)]
+            np.maximum(segment, rows[:len(segment)], out=segment)
+
+            # 只保留每条条带不与下一条重叠的部分，拼成缩小后的整页灰度图
+            keep = band[:step_px] if band_index + 1 < len(band_starts) else band
+            thumb_rows.append(cv2.resize(
+                keep, (max(1, int(keep.shape[1] * thumb_scale)), max(1, int(keep.shape[0] * thumb_scale))),
+                interpolation=cv2.INTER_AREA
+            ))
+
+    thumb = np.vstack(thumb_rows)
+
+    merged = merge_intervals(intervals, img_width * config.tile_merge_gap_ratio)
+    min_height = img_width * config.tile_min_height_ratio
+    merged = [(y0, y1) for y0, y1 in merged if y1 - y0 >= min_height]
+
+    # 唯一的区域覆盖了大部分页面时保留整页
+    if not merged or (len(merged) == 1 and
+                      (merged[0][1] - merged[0][0]) / img_height > config.full_page_coverage):
+        return [], (img_width, img_height), thumb
+
+    regions = []
+    for y_start, y_end in merged:
+        # 与 find_content_boundaries 相同的规则，只是作用在一维投影上
+        roi_proj = profile[y_start:y_end]
+        content_rows = np.flatnonzero(roi_proj > roi_proj.max() * config.boundary_threshold_ratio)
+        top, bottom = 0, len(roi_proj) - 1
+        if len(content_rows):
+            top = max(0, content_rows[0] - config.boundary_padding)
+            bottom = min(len(roi_proj) - 1, content_rows[-1] + config.boundary_padding)
+
+        final_y = y_start + top
+        final_h = bottom - top
+        margin_vertical = int(final_h * config.margin_ratio)
+        final_y = max(0, final_y - margin_vertical)
+        final_h = min(img_height - final_y, final_h + 2 * margin_vertical)
+        regions.append((int(final_y), int(final_h)))
+
+    return regions, (img_width, img_height), thumb
+
+def regions_to_boxes(regions, img_height, pdf_height):
+    """将像素区域转换为同时带有PDF坐标的 ReceiptBox"""
+    boxes = []
+    for final_y, final_h in regions:
+        # 将图像坐标转换为PDF坐标（PDF坐标系从底部开始）
+        pdf_y = pdf_height - ((final_y + final_h) / img_height) * pdf_height
+        pdf_h = (final_h / img_height) * pdf_height
+        boxes.append(ReceiptBox(final_y, final_h, pdf_y, pdf_h))
+    return boxes
+
+def analyze_page(input_pdf, page_num, page, config=DEFAULT_CONFIG, renderer=None):
+    """
+    分析单个页面，决定丢弃、原样保留还是分割
+
+    Args:
+        input_pdf: 输入PDF文件路径
+        page_num: 页码（从0开始）
+        page: pypdf页面对象
+        config: 检测参数
+        renderer: PageRenderer，为None时单独渲染这一页
+
+    Returns:
+        PageAnalysis
+    """
+    # 快速预分类：空白页丢弃，明显的单张回执单原样保留
+    if config.quick_skip:
+        verdict, thumb = quick_classify_page(input_pdf, page_num, page, config, renderer)
+        if verdict == "blank":
+            return PageAnalysis("blank")
+        elif verdict == "single":
+            return PageAnalysis("fast_single", image_size=(thumb.shape[1], thumb.shape[0]),
+                                gray=thumb, dpi=config.thumbnail_dpi)
+
+    # 获取PDF页面原始尺寸
+    pdf_height = float(page.mediabox.height)
+
+    # 细长页面按条带分块检测，避免整页渲染占用过多内存
+    if is_tall_page(page, config):
+        regions, image_size, thumb = detect_tall_page_regions(input_pdf, page_num, page, config)
+        if not regions:
+            return PageAnalysis("single", image_size=image_size, gray=thumb, dpi=config.dpi)
+        boxes = regions_to_boxes(regions, image_size[1], pdf_height)
+        return PageAnalysis("split", boxes, image_size=image_size, gray=thumb, dpi=config.dpi)
+
+    # 使用较低DPI转换为图像用于检测
+    if renderer:
+        img = renderer.render(page_num, config.dpi)
+    else:
+        img = render_page(input_pdf, page_num, config.dpi)
+
+    # 转换为灰度图
+    gray = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2GRAY)
+    img_height = gray.shape[0]
+
+    regions = detect_receipt_regions(gray, config)
+    if not regions:
+        return PageAnalysis("single", image_size=img.size, gray=gray, dpi=config.dpi)
+
+    boxes = regions_to_boxes(regions, img_height, pdf_height)
+    return PageAnalysis("split", boxes, image_size=img.size, gray=gray, dpi=config.dpi)
+
+def crop_rows(analysis, box):
+    """从 analysis.gray 中取出 box 对应的行（gray 可能是缩小后的图像）"""
+    factor = analysis.gray.shape[0] / analysis.image_size[1]
+    y0 = int(box.y * factor)
+    y1 = max(y0 + 1, int((box.y + box.h) * factor))
+    return analysis.gray[y0:y1, :]
+
+def make_thumbnail(gray, max_size):
+    """将灰度图等比缩小到最长边不超过 max_size"""
+    height, width = gray.shape[:2]
+    scale = max_size / max(height, width)
+    if scale >= 1:
+        return gray.copy()
+    size = (max(1, int(width * scale)), max(1, int(height * scale)))
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+
+def sidecar_record(source, page_num, receipt_index, analysis, box, page, output_path,
+                   output_index, duplicate_of, detect_ms):
+    """
+    生成一个回执单的位置索引记录，box 为None表示整页
+
+    analysis 为None表示整页已在去重索引中、没有渲染和检测，记录的类型为 "duplicate_page"，
+    只有来源和 duplicate_of，没有几何信息
+    """
+    page_width = float(page.mediabox.width)
+    page_height = float(page.mediabox.height)
+    if analysis is None:
+        return {
+            "source": source,
+            "page": page_num,
+            "receipt_index": receipt_index,
+            "kind": "duplicate_page",
+            "output_path": output_path,
+            "output_index": output_index,
+            "duplicate_of": duplicate_of,
+            "dpi": None,
+            "image_size": None,
+            "box_px": None,
+            "page_size": [page_width, page_height],
+            "box_pdf": None,
+            "detect_ms": round(detect_ms, 2),
+        }
+
+    image_width, image_height = analysis.image_size
+    if box is None:
+        box_px = [0, 0, image_width, image_height]
+        box_pdf = [0.0, 0.0, page_width, page_height]
+    else:
+        box_px = [0, box.y, image_width, box.h]
+        box_pdf = [0.0, round(box.pdf_y, 3), page_width, round(box.pdf_h, 3)]
+    return {
+        "source": source,
+        "page": page_num,
+        "receipt_index": receipt_index,
+        "kind": analysis.kind,
+        "output_path": output_path,
+        "output_index": output_index,
+        "duplicate_of": duplicate_of,
+        "dpi": analysis.dpi,
+        "image_size": [image_width, image_height],
+        "box_px": box_px,
+        "page_size": [page_width, page_height],
+        "box_pdf": box_pdf,
+        "detect_ms": round(detect_ms, 2),
+    }
+
+def process_pdf_with_opencv(input_pdf, output_path, progress_callback=None, config=None,
+                            control=None, progress_event_callback=None, progress_interval=0.1,
+                            thumbnail_callback=None, thumbnail_size=160, pages=None,
+                            dedup_index=None, dedup_mode="skip", sidecar_path=None,
+                            output_options=None, page_gate=None, page_filter=None,
+                            render_batch=8):
     """
     使用OpenCV处理PDF文件，检测并分割回执单，将所有回执单保存到一个PDF文件中
     
@@ -48,162 +764,274 @@ def process_pdf_with_opencv(input_pdf, output_path, progress_callback=None):
         input_pdf: 输入PDF文件路径
         output_path: 输出PDF文件路径
         progress_callback: 进度回调函数，接收两个参数：(进度百分比, 状态描述)
+        config: 检测参数 DetectionConfig，为None时使用默认参数
+        control: ProcessingControl，用于在页与页之间取消或暂停处理；
+                 取消时抛出 ProcessingCancelled，且不会留下不完整的输出文件
+        progress_event_callback: 结构化进度回调函数，接收 progress.ProgressEvent
+        progress_interval: 两次进度回调之间的最小间隔（秒），中间的更新会被合并
+        thumbnail_callback: 缩略图回调函数，接收 CropThumbnail；缩略图直接取自检测时
+                            已渲染的图像，不会额外渲染
+        thumbnail_size: 缩略图最长边的像素数
+        pages: 只处理这些页（从0开始的页码，按给定顺序），为None时处理全部页面；
+               页面对象按需解析，不会读入整个文件或展开整棵页面树
+        dedup_index: dedup_index.DedupIndex，输出前检查回执单是否已经处理过；
+                     已处理过的页面直接跳过检测，重复的回执单不再写入输出
+        dedup_mode: "skip" 只跳过重复的回执单；"link" 还会在索引中记录它指向哪条已有记录
+        sidecar_path: 位置索引文件路径（.jsonl 或 .db/.sqlite），处理过程中流式写入每个回执单的
+                      来源页、像素坐标、PDF坐标、DPI、检测耗时和输出页码，字段说明见 sidecar.py
+        output_options: 输出优化选项 output_optimizer.OutputOptions 或预设名称
+                        （"none" / "fast" / "max"），为None时不做优化
+        page_gate: 页面名额（如 governor.AdjustableSemaphore），每页在渲染和检测前获取、
+                   输出该页回执单后释放，用于在多个并行任务之间限制同时处理的页数
+        page_filter: 页面筛选函数，接收 (页码, 页面对象)，返回False的页面不处理；
+                     只应读取页面对象（如 PAGE_PREDICATES），不要渲染
+        render_batch: 一次 pdftoppm 调用最多渲染的连续页数，见 PageRenderer
+
+    Returns:
+        处理统计信息字典：总页数、回执单数量、走快速通道的页数、丢弃的空白页数、
+        重复的页数和回执单数，以及输出优化报告（output）
     """
-    if progress_callback:
-        progress_callback(0, f"正在处理PDF: {input_pdf}")
+    config = config or DEFAULT_CONFIG
+    tracker = ProgressTracker(progress_callback, progress_event_callback, progress_interval)
+    if dedup_mode not in ("skip", "link"):
+        raise ValueError(f"未知的去重模式: {dedup_mode}")
     
-    # 打开原始PDF文件
-    pdf_reader = PdfReader(input_pdf)
-    pdf_writer = PdfWriter()
-    
-    # 获取总页数
-    total_pages = len(pdf_reader.pages)
-    
-    if progress_callback:
-        progress_callback(1, f"总页数: {total_pages}")
+    # 打开原始PDF文件，页面按需解析
+    page_tree = LazyPageTree(input_pdf)
+    # 进入主循环之前出错（页面筛选、位置索引扩展名不对等）也要关闭文件
+    try:
+        pdf_writer = PdfWriter()
+
+        # 获取总页数
+        total_pages = page_tree.page_count
+        page_numbers = range(total_pages) if pages is None else list(pages)
+        if page_filter:
+            page_numbers = [page_num for page_num in page_numbers
+                            if page_filter(page_num, page_tree.get_page(page_num))]
+        # 细长页面按条带分块渲染，不能被整页预取；有页面名额时只预取缩略图
+        renderer = PageRenderer(
+            input_pdf, page_numbers, render_batch,
+            can_prefetch=lambda page_num: not is_tall_page(page_tree.get_page(page_num), config),
+            max_prefetch_dpi=config.thumbnail_dpi if page_gate else None,
+        )
+
+        source = os.path.abspath(input_pdf)
+        output_abspath = os.path.abspath(output_path)
+        sidecar = open_sidecar(sidecar_path) if sidecar_path else None
+    except BaseException:
+        page_tree.close()
+        raise
 
     # 处理每一页
     total_receipts = 0
-    for page_num in range(total_pages):
-        if progress_callback:
-            progress = int((page_num / total_pages) * 98) + 1
-            progress_callback(progress, f"正在处理第 {page_num + 1}/{total_pages} 页")
-        
-        # 获取原始页面
-        original_page = pdf_reader.pages[page_num]
-        
-        # 获取PDF页面原始尺寸
-        pdf_width = float(original_page.mediabox.width)
-        pdf_height = float(original_page.mediabox.height)
-        
-        # 使用较低DPI转换为图像用于检测
-        if sys.platform == "darwin":
-            images = convert_from_path(input_pdf, dpi=100, first_page=page_num+1, 
-                                    last_page=page_num+1, poppler_path="/opt/homebrew/bin")
-        else:
-            images = convert_from_path(input_pdf, dpi=100, first_page=page_num+1, 
-                                    last_page=page_num+1)
-        img = images[0]
-        
-        # 获取图像尺寸用于坐标转换
-        img_height = img.size[1]
-        
-        # 转换为OpenCV格式
-        cv_img = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
-        
-        # 转换为灰度图
-        gray = cv2.cvtColor(cv_img, cv2.COLOR_BGR2GRAY)
-        
-        # 使用自适应阈值处理
-        binary = cv2.adaptiveThreshold(
-            gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-            cv2.THRESH_BINARY_INV, 25, 15
-        )
-        
-        # 进行形态学操作
-        kernel = np.ones((5,5), np.uint8)
-        dilated = cv2.dilate(binary, kernel, iterations=2)
-        eroded = cv2.erode(dilated, kernel, iterations=1)
-        
-        # 查找轮廓
-        contours, hierarchy = cv2.findContours(
-            eroded, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
-        )
-        
-        # 调整最小区域面积的要求
-        min_area = img.size[0] * img.size[1] * 0.05
-        
-        # 过滤并排序轮廓（按垂直位置）
-        valid_contours = []
-        for cnt in contours:
-            area = cv2.contourArea(cnt)
-            if area > min_area:
-                x, y, w, h = cv2.boundingRect(cnt)
-                if 0.05 <= h / img_height <= 0.6:
-                    valid_contours.append((y, y + h))  # 只保存垂直位置
-        
-        # 按y坐标排序
-        valid_contours.sort()
-        
-        # 如果没有找到有效的分割区域，保留整页
-        if not valid_contours:
-            pdf_writer.add_page(original_page)
-            total_receipts += 1
-            continue
-        elif len(valid_contours) == 1:
-            # 检查唯一的区域是否覆盖了大部分页面
-            y_start, y_end = valid_contours[0]
-            coverage = (y_end - y_start) / img_height
-            if coverage > 0.7:  # 如果覆盖了70%以上的页面
-                pdf_writer.add_page(original_page)
-                total_receipts += 1
-                continue
-        
-        # 处理需要分割的页面
-        total_receipts += len(valid_contours)
-        
-        if progress_callback:
-            progress_callback(progress, f"第 {page_num + 1} 页找到 {len(valid_contours)} 个回执单")
-        
-        # 处理每个区域
-        for idx, (y_start, y_end) in enumerate(valid_contours):
-            # 提取当前区域的灰度图像
-            roi_gray = gray[y_start:y_end, :]
-            
-            # 分析内容边界（只分析垂直方向）
-            top, bottom = find_content_boundaries(roi_gray)
-            
-            # 计算最终的裁剪区域
-            final_y = y_start + top
-            final_h = bottom - top
-            
-            # 添加动态边距
-            margin_ratio = 0.08
-            margin_vertical = int(final_h * margin_ratio)
-            
-            final_y = max(0, final_y - margin_vertical)
-            final_h = min(img_height - final_y, final_h + 2 * margin_vertical)
-            
-            # 将图像坐标转换为PDF坐标（PDF坐标系从底部开始）
-            pdf_y = pdf_height - ((final_y + final_h) / img_height) * pdf_height
-            pdf_h = (final_h / img_height) * pdf_height
-            
-            # 创建新页面并设置裁剪框
-            new_page = pdf_reader.pages[page_num]
-            new_page.cropbox.lower_left = (0, pdf_y)  # 使用原始PDF的完整宽度
-            new_page.cropbox.upper_right = (pdf_width, pdf_y + pdf_h)
+    fast_path_pages = 0
+    blank_pages = 0
+    duplicate_pages = 0
+    duplicate_receipts = 0
+    try:
+        tracker.start(len(page_numbers), input_pdf)
+        for page_num in page_numbers:
+            if control:
+                control.checkpoint()
             
-            # 添加裁剪后的页面
-            pdf_writer.add_page(new_page)
+            # 获取原始页面
+            original_page = page_tree.get_page(page_num)
+            pdf_width = float(original_page.mediabox.width)
+
+            # 整页已经处理过：不渲染、不检测，其中的回执单全部视为重复
+            if dedup_index:
+                page_hash = page_content_hash(original_page)
+                known_ids = dedup_index.page_receipt_ids(page_hash)
+                if known_ids is not None:
+                    for idx, receipt_id in enumerate(known_ids):
+                        if dedup_mode == "link":
+                            dedup_index.add_link(receipt_id, page_hash, source, page_num, idx)
+                        if sidecar:
+                            sidecar.write(sidecar_record(
+                                source, page_num, idx, None, None, original_page,
+                                output_abspath, None, receipt_id, 0.0
+                            ))
+                    duplicate_pages += 1
+                    duplicate_receipts += len(known_ids)
+                    if tracker.enabled:
+                        tracker.page_done(0, get_content_stream_size(original_page))
+                    continue
+
+            page_receipts = 0
+            page_receipt_ids = []
+            # 渲染和检测阶段占用内存最多，由 page_gate 限制同时处于该阶段的页数
+            with page_gate or nullcontext():
+                detect_start = time.perf_counter()
+                analysis = analyze_page(input_pdf, page_num, original_page, config, renderer)
+                detect_ms = (time.perf_counter() - detect_start) * 1000
+
+                # 整理出该页要输出的回执单：(裁剪框, 对应的灰度图)，裁剪框为None表示整页
+                if analysis.kind == "blank":
+                    fast_path_pages += 1
+                    blank_pages += 1
+                    crops = []
+                elif analysis.kind in ("fast_single", "single"):
+                    if analysis.kind == "fast_single":
+                        fast_path_pages += 1
+                    crops = [(None, analysis.gray)]
+                else:
+                    crops = [(box, crop_rows(analysis, box)) for box in analysis.boxes]
+
+                for idx, (box, crop_gray) in enumerate(crops):
+                    duplicate_id = None
+                    if dedup_index:
+                        phash = perceptual_hash(crop_gray)
+                        detail = detail_signature(crop_gray)
+                        duplicate_id = dedup_index.find_receipt(phash, detail)
+                        if duplicate_id is not None:
+                            if dedup_mode == "link":
+                                dedup_index.add_link(duplicate_id, page_hash, source, page_num, idx)
+                            duplicate_receipts += 1
+                            page_receipt_ids.append(duplicate_id)
+
+                    if sidecar:
+                        sidecar.write(sidecar_record(
+                            source, page_num, idx, analysis, box, original_page, output_abspath,
+                            None if duplicate_id is not None else len(pdf_writer.pages),
+                            duplicate_id, detect_ms
+                        ))
+
+                    if duplicate_id is not None:
+                        continue
+                    if dedup_index:
+                        page_receipt_ids.append(dedup_index.add_receipt(
+                            phash, detail, page_hash, source, page_num, idx,
+                            output_abspath, len(pdf_writer.pages)
+                        ))
+
+                    if thumbnail_callback:
+                        thumbnail_callback(CropThumbnail(
+                            page_num, idx, len(pdf_writer.pages),
+                            make_thumbnail(crop_gray, thumbnail_size)
+                        ))
+
+                    if box is None:
+                        pdf_writer.add_page(original_page)
+                    else:
+                        # 创建新页面并设置裁剪框
+                        new_page = page_tree.get_page(page_num)
+                        new_page.cropbox.lower_left = (0, box.pdf_y)  # 使用原始PDF的完整宽度
+                        new_page.cropbox.upper_right = (pdf_width, box.pdf_y + box.pdf_h)
+                    
+                        # 添加裁剪后的页面
+                        pdf_writer.add_page(new_page)
+                    page_receipts += 1
+
+                if dedup_index:
+                    dedup_index.add_page(page_hash, page_receipt_ids)
+                # 在释放页面名额之前丢掉本页的图像
+                analysis = crops = crop_gray = None
+
+            total_receipts += page_receipts
+            if tracker.enabled:
+                tracker.page_done(page_receipts, get_content_stream_size(original_page))
+
+        # 保存合并后的PDF
+        output_dir = os.path.dirname(output_path)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
             
-            if progress_callback:
-                progress_callback(progress, f"添加第 {page_num + 1} 页的第 {idx + 1} 个回执单")
+        if control:
+            control.checkpoint()
 
-    # 保存合并后的PDF
-    output_dir = os.path.dirname(output_path)
-    if output_dir and not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-        
-    with open(output_path, 'wb') as output_file:
-        pdf_writer.write(output_file)
+        tracker.saving(output_path)
+
+        # 先写入临时文件再重命名，避免中途失败留下不完整的输出
+        temp_path = output_path + ".part"
+        try:
+            output_report = write_pdf(pdf_writer, temp_path, output_options)
+            os.replace(temp_path, output_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+    except BaseException:
+        # 输出没有写成，索引中本次新增的记录也作废
+        if dedup_index:
+            dedup_index.rollback()
+        if sidecar:
+            sidecar.abort()
+        raise
+    finally:
+        page_tree.close()
+
+    if dedup_index:
+        dedup_index.commit()
+    if sidecar:
+        sidecar.commit()
     
-    if progress_callback:
-        progress_callback(100, f"已保存合并后的PDF文件: {output_path}")
+    tracker.finish(f"{output_path}（快速通道 {fast_path_pages} 页，丢弃空白页 {blank_pages} 页，"
+                   f"重复回执单 {duplicate_receipts} 个）")
+
+    return {
+        "total_pages": len(page_numbers),
+        "total_receipts": total_receipts,
+        "fast_path_pages": fast_path_pages,
+        "blank_pages": blank_pages,
+        "duplicate_pages": duplicate_pages,
+        "duplicate_receipts": duplicate_receipts,
+        "seconds": tracker.snapshot().elapsed,
+        "output": output_report,
+    }
 
 def main():
+    parser = argparse.ArgumentParser(description="检测并分割PDF中的回执单")
+    parser.add_argument("input_pdf", nargs="?", default="./receipts.pdf", help="输入PDF文件")
+    parser.add_argument("output_pdf", nargs="?", default="./output_opencv/merged_receipts.pdf",
+                        help="输出PDF文件")
+    parser.add_argument("--dedup-index", help="去重索引数据库路径，已处理过的回执单不再输出")
+    parser.add_argument("--dedup-mode", choices=["skip", "link"], default="skip",
+                        help="重复回执单的处理方式：跳过，或跳过并在索引中记录指向已有记录的链接")
+    parser.add_argument("--sidecar", help="同时输出回执单位置索引（.jsonl 或 .db/.sqlite）")
+    parser.add_argument("--optimize", choices=sorted(PRESETS), default="fast",
+                        help="输出优化：none 不优化，fast 合并相同对象，max 全部优化（对象流需要 pikepdf）")
+    parser.add_argument("--optimize-report", action="store_true",
+                        help="额外计算未优化时的体积，报告优化前后的对比")
+    parser.add_argument("--pages", help="只处理这些页，如 1-10,20,30-（页码从1开始）")
+    parser.add_argument("--where", choices=sorted(PAGE_PREDICATES),
+                        help="只处理满足条件的页：has-content 有内容，has-images 含图像，tall 细长页面")
+    args = parser.parse_args()
+
+    dedup_index = None
     try:
-        # 设置输入和输出路径
-        input_pdf = "./receipts.pdf"
-        output_pdf = "./output_opencv/merged_receipts.pdf"
+        if args.dedup_index:
+            dedup_index = DedupIndex(args.dedup_index)
+        
+        pages = None
+        if args.pages:
+            with LazyPageTree(args.input_pdf) as page_tree:
+                pages = parse_page_ranges(args.pages, page_tree.page_count)
+        page_filter = None
+        if args.where:
+            predicate = PAGE_PREDICATES[args.where]
+            page_filter = lambda page_num, page: predicate(page, DEFAULT_CONFIG)
         
-        # 处理所有页面
-        process_pdf_with_opencv(input_pdf, output_pdf)
+        # 处理选中的页面（未指定时处理所有页面）
+        stats = process_pdf_with_opencv(args.input_pdf, args.output_pdf,
+                                        pages=pages, page_filter=page_filter,
+                                        dedup_index=dedup_index, dedup_mode=args.dedup_mode,
+                                        sidecar_path=args.sidecar,
+                                        output_options=PRESETS[args.optimize].replace(
+                                            measure_baseline=args.optimize_report))
         print("\n处理完成！")
+        print(f"共 {stats['total_pages']} 页，{stats['total_receipts']} 个回执单，"
+              f"其中 {stats['fast_path_pages']} 页走快速通道（空白页 {stats['blank_pages']} 页）")
+        print(format_report(stats["output"]))
+        if dedup_index:
+            print(f"跳过重复页面 {stats['duplicate_pages']} 页，重复回执单 {stats['duplicate_receipts']} 个")
         
     except Exception as e:
         print(f"处理过程中出现错误: {str(e)}")
         import traceback
         traceback.print_exc()
+    finally:
+        if dedup_index:
+            dedup_index.close()
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,278 @@
+"""
+检测参数调优工具
+
+在本地标注好的语料上并行扫描 DetectionConfig 的参数组合，
+对每组参数同时给出检测准确率（与标注框比对）和处理速度（页/秒），
+便于选出满足准确率要求的最快参数。
+
+语料目录结构：
+    corpus/
+    ├── labels.json
+    ├── statement_a.pdf
+    └── statement_b.pdf
+
+labels.json 以文件名为键，页码（从1开始）为二级键，值为该页回执单的垂直区域列表，
+坐标为从页面顶部算起的PDF点 [top, bottom]；整页即一张回执单时可写 "full"，空白页写 []：
+    {
+        "statement_a.pdf": {"1": [[40, 380], [420, 760]], "2": "full", "3": []}
+    }
+
+参数网格为JSON，键为 DetectionConfig 的字段名，值为候选取值列表：
+    {"dpi": [72, 100], "adaptive_block_size": [15, 25], "quick_skip": [true, false]}
+
+用法：
+    python src/tune_detection.py corpus/ --grid grid.json --workers 8 --min-f1 0.95
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from page_loader import LazyPageTree
+from split_pdf_opencv import DetectionConfig, PageRenderer, analyze_page, is_tall_page
+
+
+DEFAULT_GRID = {
+    "dpi": [72, 100, 150],
+    "quick_skip": [True, False],
+}
+
+
+def expand_grid(grid):
+    """
+    将参数网格展开为 DetectionConfig 列表
+
+    Returns:
+        (合法的参数列表, [(非法的参数组合, 原因)])
+    """
+    keys = sorted(grid)
+    configs = []
+    invalid = []
+    for values in itertools.product(*(grid[k] for k in keys)):
+        changes = dict(zip(keys, values))
+        try:
+            configs.append(DetectionConfig().replace(**changes))
+        except (ValueError, TypeError) as e:
+            invalid.append((changes, str(e)))
+    return configs, invalid
+
+def interval_iou(a, b):
+    """计算两个一维区间 [top, bottom] 的交并比"""
+    inter = max(0.0, min(a[1], b[1]) - max(a[0], b[0]))
+    union = max(a[1], b[1]) - min(a[0], b[0])
+    return inter / union if union > 0 else 0.0
+
+def match_boxes(predicted, truth, iou_threshold):
+    """
+    贪心匹配预测框和标注框
+
+    Returns:
+        (tp, fp, fn, 匹配上的框的IoU之和)
+    """
+    pairs = []
+    for i, p in enumerate(predicted):
+        for j, t in enumerate(truth):
+            iou = interval_iou(p, t)
+            if iou >= iou_threshold:
+                pairs.append((iou, i, j))
+    pairs.sort(reverse=True)
+
+    used_p, used_t = set(), set()
+    iou_sum = 0.0
+    for iou, i, j in pairs:
+        if i in used_p or j in used_t:
+            continue
+        used_p.add(i)
+        used_t.add(j)
+        iou_sum += iou
+
+    tp = len(used_p)
+    return tp, len(predicted) - tp, len(truth) - tp, iou_sum
+
+def predicted_boxes(analysis, page_height):
+    """把 PageAnalysis 转换为从页面顶部算起的 [top, bottom] PDF坐标列表"""
+    if analysis.kind == "blank":
+        return []
+    if analysis.kind in ("fast_single", "single"):
+        return [(0.0, page_height)]
+    return [(page_height - box.pdf_y - box.pdf_h, page_height - box.pdf_y)
+            for box in analysis.boxes]
+
+def evaluate_file(config_dict, pdf_path, page_labels, iou_threshold):
+    """
+    在单个PDF的标注页上评估一组参数（在工作进程中运行）
+
+    Returns:
+        统计字典：tp/fp/fn/iou_sum/pages/seconds
+    """
+    config = DetectionConfig.from_dict(config_dict)
+    stats = {"tp": 0, "fp": 0, "fn": 0, "iou_sum": 0.0, "pages": 0, "seconds": 0.0}
+    # 只解析标注过的页面，按页码顺序处理以便批量渲染
+    page_labels = sorted(page_labels.items(), key=lambda item: int(item[0]))
+
+    with LazyPageTree(pdf_path) as page_tree:
+        renderer = PageRenderer(
+            pdf_path, [int(page_key) - 1 for page_key, _ in page_labels],
+            can_prefetch=lambda page_num: not is_tall_page(page_tree.get_page(page_num), config),
+        )
+        for page_key, truth in page_labels:
+            page_num = int(page_key) - 1
+            page = page_tree.get_page(page_num)
+            page_height = float(page.mediabox.height)
+            if truth == "full":
+                truth = [(0.0, page_height)]
+
+            start = time.perf_counter()
+            analysis = analyze_page(pdf_path, page_num, page, config, renderer)
+            stats["seconds"] += time.perf_counter() - start
+            stats["pages"] += 1
+
+            tp, fp, fn, iou_sum = match_boxes(
+                predicted_boxes(analysis, page_height), truth, iou_threshold
+            )
+            stats["tp"] += tp
+            stats["fp"] += fp
+            stats["fn"] += fn
+            stats["iou_sum"] += iou_sum
+
+    return stats
+
+def summarize(config, stats, error=None):
+    """汇总一组参数在整个语料上的结果；评估出错时 error 为错误信息，各项指标按0计"""
+    if error is not None:
+        return {"config": config.to_dict(), "error": error, "precision": 0.0, "recall": 0.0,
+                "f1": 0.0, "mean_iou": 0.0, "pages": 0, "pages_per_sec": 0.0}
+    tp, fp, fn = stats["tp"], stats["fp"], stats["fn"]
+    precision = tp / (tp + fp) if tp + fp else 1.0
+    recall = tp / (tp + fn) if tp + fn else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {
+        "config": config.to_dict(),
+        "precision": precision,
+        "recall": recall,
+        "f1": f1,
+        "mean_iou": stats["iou_sum"] / tp if tp else 0.0,
+        "pages": stats["pages"],
+        "pages_per_sec": stats["pages"] / stats["seconds"] if stats["seconds"] else 0.0,
+        "error": None,
+    }
+
+def run_sweep(corpus_dir, labels, configs, workers=None, iou_threshold=0.7,
+              progress_callback=None):
+    """
+    并行扫描所有参数组合
+
+    每个 (参数, 文件) 组合是一个独立任务；速度按各任务自身的检测耗时统计，
+    与并行度无关（需要更干净的计时可以使用 workers=1）。
+
+    Args:
+        corpus_dir: 语料目录
+        labels: 标注字典
+        configs: DetectionConfig 列表
+        workers: 进程数，None 表示使用CPU核数
+        iou_threshold: 预测框与标注框匹配所需的最小IoU
+        progress_callback: 进度回调函数，接收两个参数：(已完成任务数, 总任务数)
+
+    Returns:
+        每组参数的汇总结果列表；某组参数在任一文件上出错时，该组结果带有 error，
+        其它参数的结果不受影响
+    """
+    totals = [{"tp": 0, "fp": 0, "fn": 0, "iou_sum": 0.0, "pages": 0, "seconds": 0.0}
+              for _ in configs]
+    errors = [None] * len(configs)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for index, config in enumerate(configs):
+            for file_name, page_labels in labels.items():
+                future = executor.submit(
+                    evaluate_file, config.to_dict(),
+                    os.path.join(corpus_dir, file_name), page_labels, iou_threshold
+                )
+                futures[future] = index
+
+        done = 0
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                for key, value in future.result().items():
+                    totals[index][key] += value
+            except Exception as e:
+                errors[index] = errors[index] or f"{type(e).__name__}: {e}"
+            done += 1
+            if progress_callback:
+                progress_callback(done, len(futures))
+
+    return [summarize(config, stats, error)
+            for config, stats, error in zip(configs, totals, errors)]
+
+def rank_results(results, min_f1):
+    """满足准确率要求的参数按速度从快到慢排在前面，其余按F1排序（出错的F1为0，排在最后）"""
+    passing = sorted((r for r in results if r["f1"] >= min_f1),
+                     key=lambda r: r["pages_per_sec"], reverse=True)
+    failing = sorted((r for r in results if r["f1"] < min_f1),
+                     key=lambda r: r["f1"], reverse=True)
+    return passing, failing
+
+def format_changes(config_dict):
+    """只显示与默认参数不同的字段"""
+    defaults = DetectionConfig().to_dict()
+    changes = {k: v for k, v in config_dict.items() if defaults[k] != v}
+    return json.dumps(changes, ensure_ascii=False) if changes else "(默认参数)"
+
+def main():
+    parser = argparse.ArgumentParser(description="在标注语料上扫描检测参数")
+    parser.add_argument("corpus", help="语料目录")
+    parser.add_argument("--labels", help="标注文件，默认为 <语料目录>/labels.json")
+    parser.add_argument("--grid", help="参数网格JSON文件")
+    parser.add_argument("--workers", type=int, default=None, help="并行进程数")
+    parser.add_argument("--iou", type=float, default=0.7, help="匹配所需的最小IoU")
+    parser.add_argument("--min-f1", type=float, default=0.95, help="准确率要求（F1）")
+    parser.add_argument("--output", help="将全部结果写入JSON文件")
+    args = parser.parse_args()
+
+    labels_path = args.labels or os.path.join(args.corpus, "labels.json")
+    with open(labels_path, encoding="utf-8") as f:
+        labels = json.load(f)
+
+    grid = DEFAULT_GRID
+    if args.grid:
+        with open(args.grid, encoding="utf-8") as f:
+            grid = json.load(f)
+    configs, invalid = expand_grid(grid)
+
+    print(f"共 {len(configs)} 组参数，{len(labels)} 个文件")
+    for changes, reason in invalid:
+        print(f"  跳过非法参数 {json.dumps(changes, ensure_ascii=False)}：{reason}")
+
+    def progress_callback(done, total):
+        print(f"\r已完成 {done}/{total}", end="", file=sys.stderr)
+
+    results = run_sweep(args.corpus, labels, configs, args.workers, args.iou,
+                        progress_callback)
+    print(file=sys.stderr)
+
+    passing, failing = rank_results(results, args.min_f1)
+    print(f"\n满足 F1 >= {args.min_f1} 的参数（按速度排序）：")
+    for r in passing:
+        print(f"  {r['pages_per_sec']:7.2f} 页/秒  F1={r['f1']:.3f}  "
+              f"P={r['precision']:.3f}  R={r['recall']:.3f}  {format_changes(r['config'])}")
+    if not passing:
+        print("  无")
+    print("\n未达标的参数：")
+    for r in failing:
+        if r["error"]:
+            print(f"  评估出错  {format_changes(r['config'])}：{r['error']}")
+            continue
+        print(f"  {r['pages_per_sec']:7.2f} 页/秒  F1={r['f1']:.3f}  "
+              f"P={r['precision']:.3f}  R={r['recall']:.3f}  {format_changes(r['config'])}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(passing + failing, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+from pypdf import PdfWriter
+from pypdf.generic import DecodedStreamObject, NameObject
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import split_pdf_opencv  # noqa: E402
+from split_pdf_opencv import PageAnalysis, ReceiptBox  # noqa: E402
+
+
+def make_pdf(path, pages, width=612, height=792):
+    """生成每页内容流都不同的PDF（页面内容哈希互不相同）"""
+    writer = PdfWriter()
+    for page_num in range(pages):
+        page = writer.add_blank_page(width, height)
+        stream = DecodedStreamObject()
+        stream.set_data(f"0 0 m {page_num + 1} 10 l S".encode())
+        page[NameObject("/Contents")] = writer._add_object(stream)
+    with open(path, "wb") as f:
+        writer.write(f)
+    return path
+
+
+def stub_analysis(page_num, page, receipts=2):
+    """每页分成 receipts 个回执单，各自是由 (页码, 序号) 决定的随机图案"""
+    band = 100
+    gray = np.full((band * receipts, 200), 255, np.uint8)
+    boxes = []
+    pdf_height = float(page.mediabox.height)
+    for idx in range(receipts):
+        rng = np.random.default_rng(page_num * 1000 + idx)
+        gray[idx * band:(idx + 1) * band] = rng.integers(0, 256, (band, 200), dtype=np.uint8)
+        pdf_h = pdf_height / receipts
+        boxes.append(ReceiptBox(idx * band, band, pdf_height - (idx + 1) * pdf_h, pdf_h))
+    return PageAnalysis("split", boxes, image_size=(200, band * receipts), gray=gray, dpi=100)
+
+
+@pytest.fixture
+def stub_detection(monkeypatch):
+    """用固定结果代替渲染和检测，不需要 poppler"""
+    calls = []
+
+    def analyze_page(input_pdf, page_num, page, config=None, renderer=None):
+        calls.append(page_num)
+        return stub_analysis(page_num, page)
+
+    monkeypatch.setattr(split_pdf_opencv, "analyze_page", analyze_page)
+    return calls
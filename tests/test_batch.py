@@ -0,0 +1,66 @@
+import threading
+import time
+
+import batch
+from batch import run_batch
+from governor import ConcurrencyGovernor
+from test_governor import FakeClock, FakeSampler
+
+
+def test_run_batch_scales_up_and_collects_results(monkeypatch):
+    lock = threading.Lock()
+    running = {"now": 0, "peak": 0}
+    gates = set()
+
+    def process_pdf_with_opencv(input_pdf, output_path, page_gate=None, **kwargs):
+        gates.add(id(page_gate))
+        with lock:
+            running["now"] += 1
+            running["peak"] = max(running["peak"], running["now"])
+        time.sleep(0.05)
+        with lock:
+            running["now"] -= 1
+        if input_pdf == "bad.pdf":
+            raise ValueError("损坏的文件")
+        return {"input": input_pdf, "options": kwargs}
+
+    monkeypatch.setattr(batch, "process_pdf_with_opencv", process_pdf_with_opencv)
+    gov = ConcurrencyGovernor(min_workers=1, max_workers=3, cooldown=0,
+                              sampler=FakeSampler(cpu=0.1), clock=FakeClock())
+    jobs = [(f"{i}.pdf", f"out/{i}.pdf") for i in range(8)] + [("bad.pdf", "out/bad.pdf")]
+    finished = []
+
+    results = run_batch(jobs, gov, interval=0.01, output_options="fast",
+                        on_result=lambda input_pdf, stats, error: finished.append(input_pdf))
+
+    assert set(results) == {input_pdf for input_pdf, _ in jobs}
+    assert sorted(finished) == sorted(results)
+    assert isinstance(results["bad.pdf"], ValueError)
+    assert results["0.pdf"] == {"input": "0.pdf", "options": {"output_options": "fast"}}
+    assert gates == {id(gov.page_gate)}
+    assert gov.target_workers == 3
+    assert 2 <= running["peak"] <= 3
+
+
+def test_run_batch_does_not_exceed_target_workers(monkeypatch):
+    lock = threading.Lock()
+    running = {"now": 0, "peak": 0}
+
+    def process_pdf_with_opencv(input_pdf, output_path, page_gate=None, **kwargs):
+        with lock:
+            running["now"] += 1
+            running["peak"] = max(running["peak"], running["now"])
+        time.sleep(0.02)
+        with lock:
+            running["now"] -= 1
+        return {}
+
+    monkeypatch.setattr(batch, "process_pdf_with_opencv", process_pdf_with_opencv)
+    # CPU 已满：维持初始的2个工作线程
+    gov = ConcurrencyGovernor(min_workers=1, max_workers=8, cooldown=0,
+                              sampler=FakeSampler(cpu=0.99), clock=FakeClock())
+    results = run_batch([(f"{i}.pdf", f"{i}_out.pdf") for i in range(10)], gov, interval=0.01)
+
+    assert len(results) == 10
+    assert gov.target_workers == 2
+    assert running["peak"] == 2
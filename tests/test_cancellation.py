@@ -0,0 +1,120 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import split_pdf_opencv
+from conftest import make_pdf, stub_analysis
+from dedup_index import DedupIndex
+from split_pdf_opencv import ProcessingCancelled, ProcessingControl, process_pdf_with_opencv
+
+
+def run_in_thread(target):
+    done = threading.Event()
+    errors = []
+
+    def run():
+        try:
+            target()
+        except BaseException as e:
+            errors.append(e)
+        done.set()
+
+    threading.Thread(target=run, daemon=True).start()
+    return done, errors
+
+
+@pytest.fixture
+def hooked_detection(monkeypatch):
+    """用固定结果代替检测，并在检测完指定页后调用 hooks[页码]()"""
+    calls = []
+    hooks = {}
+
+    def analyze_page(input_pdf, page_num, page, config=None, renderer=None):
+        calls.append(page_num)
+        if page_num in hooks:
+            hooks[page_num]()
+        return stub_analysis(page_num, page)
+
+    monkeypatch.setattr(split_pdf_opencv, "analyze_page", analyze_page)
+    return calls, hooks
+
+
+def test_checkpoint_blocks_while_paused():
+    control = ProcessingControl()
+    control.checkpoint()
+    control.pause()
+    assert control.is_paused
+
+    done, errors = run_in_thread(control.checkpoint)
+    assert not done.wait(0.1)
+    control.resume()
+    assert done.wait(1)
+    assert errors == []
+
+
+def test_cancel_wakes_paused_checkpoint():
+    control = ProcessingControl()
+    control.pause()
+    done, errors = run_in_thread(control.checkpoint)
+    assert not done.wait(0.1)
+
+    control.cancel()
+    assert done.wait(1)
+    assert [type(e) for e in errors] == [ProcessingCancelled]
+    assert control.is_cancelled and not control.is_paused
+
+
+@pytest.mark.parametrize("cancel_after", [0, 2, 4])
+def test_cancel_stops_between_pages_and_leaves_nothing(tmp_path, hooked_detection, cancel_after):
+    calls, hooks = hooked_detection
+    db_path = tmp_path / "dedup.db"
+    index = DedupIndex(str(db_path))
+    # 已有的记录来自第8、9页，与本次处理的第0~4页的检测结果（由页码决定）都不相同
+    process_pdf_with_opencv(str(make_pdf(tmp_path / "old.pdf", 10)), str(tmp_path / "old_out.pdf"),
+                            dedup_index=index, pages=[8, 9])
+    calls.clear()
+
+    control = ProcessingControl()
+    hooks[cancel_after] = control.cancel
+    output = tmp_path / "out.pdf"
+    sidecar = tmp_path / "receipts.jsonl"
+    input_pdf = make_pdf(tmp_path / "in.pdf", 5)
+    with pytest.raises(ProcessingCancelled):
+        process_pdf_with_opencv(str(input_pdf), str(output), control=control,
+                                dedup_index=index, sidecar_path=str(sidecar))
+    index.close()
+
+    # 当前页处理完后，在下一页开始前（或保存前）退出
+    assert calls == list(range(cancel_after + 1))
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "dedup.db", "in.pdf", "old.pdf", "old_out.pdf"]
+    conn = sqlite3.connect(db_path)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM receipts").fetchone()[0] == 4
+        assert conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0] == 2
+    finally:
+        conn.close()
+
+
+def test_pause_holds_processing_until_resumed(tmp_path, hooked_detection):
+    calls, hooks = hooked_detection
+    control = ProcessingControl()
+    hooks[1] = control.pause
+    output = tmp_path / "out.pdf"
+
+    done, errors = run_in_thread(lambda: process_pdf_with_opencv(
+        str(make_pdf(tmp_path / "in.pdf", 4)), str(output), control=control))
+    deadline = time.monotonic() + 2
+    while not control.is_paused and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not done.wait(0.2)
+    assert calls == [0, 1]
+    assert not output.exists()
+
+    control.resume()
+    assert done.wait(5)
+    assert errors == []
+    assert calls == [0, 1, 2, 3]
+    assert output.exists()
@@ -0,0 +1,143 @@
+import json
+import sqlite3
+
+import numpy as np
+import pytest
+
+import dedup_index
+from conftest import make_pdf
+from dedup_index import DedupIndex, detail_signature, perceptual_hash
+from split_pdf_opencv import process_pdf_with_opencv
+
+
+def run(tmp_path, input_pdf, db_path, mode, name, sidecar_path=None):
+    index = DedupIndex(str(db_path))
+    try:
+        return process_pdf_with_opencv(str(input_pdf), str(tmp_path / name),
+                                       dedup_index=index, dedup_mode=mode,
+                                       sidecar_path=sidecar_path and str(sidecar_path))
+    finally:
+        index.close()
+
+
+def count(db_path, table):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_rerun_in_link_mode_does_not_multiply_links(tmp_path, stub_detection):
+    input_pdf = make_pdf(tmp_path / "in.pdf", 5)
+    db_path = tmp_path / "dedup.db"
+
+    first = run(tmp_path, input_pdf, db_path, "link", "out0.pdf")
+    assert first["total_receipts"] == 10
+    assert first["duplicate_receipts"] == 0
+
+    for i in range(1, 5):
+        stats = run(tmp_path, input_pdf, db_path, "link", f"out{i}.pdf")
+        assert stats["duplicate_pages"] == 5
+        assert stats["duplicate_receipts"] == 10
+        assert stats["total_receipts"] == 0
+        assert count(db_path, "links") == 10
+    assert count(db_path, "receipts") == 10
+
+
+def test_page_of_receipt_level_duplicates_remembers_its_ids(tmp_path, stub_detection):
+    db_path = tmp_path / "dedup.db"
+    original = make_pdf(tmp_path / "a.pdf", 2)
+    run(tmp_path, original, db_path, "skip", "a_out.pdf")
+
+    # 内容流不同（页面哈希不同），但检测出的回执单图像与 a.pdf 相同
+    rescanned = tmp_path / "b.pdf"
+    make_pdf(rescanned, 2, width=600)
+    stats = run(tmp_path, rescanned, db_path, "skip", "b_out.pdf")
+    assert stats["duplicate_pages"] == 0
+    assert stats["duplicate_receipts"] == 4
+
+    stats = run(tmp_path, rescanned, db_path, "skip", "b_out2.pdf")
+    assert stats["duplicate_pages"] == 2
+    assert stats["duplicate_receipts"] == 4
+    assert len(stub_detection) == 4  # 第三次运行不再检测
+
+
+def read_sidecar(path):
+    if path.suffix == ".jsonl":
+        return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    try:
+        return [dict(row) for row in conn.execute("SELECT * FROM receipts ORDER BY page, receipt_index")]
+    finally:
+        conn.close()
+
+
+def read_sidecar_after(tmp_path, input_pdf, db_path, name):
+    sidecar_path = tmp_path / name
+    run(tmp_path, input_pdf, db_path, "skip", name + ".pdf", sidecar_path)
+    return read_sidecar(sidecar_path)
+
+
+@pytest.mark.parametrize("ext", [".jsonl", ".db"])
+def test_skipped_duplicate_page_is_recorded_in_sidecar(tmp_path, stub_detection, ext):
+    input_pdf = make_pdf(tmp_path / "in.pdf", 2)
+    db_path = tmp_path / "dedup.db"
+    first = read_sidecar_after(tmp_path, input_pdf, db_path, "first" + ext)
+    second = read_sidecar_after(tmp_path, input_pdf, db_path, "second" + ext)
+
+    assert len(second) == len(first) == 4
+    for old, new in zip(first, second):
+        assert (new["page"], new["receipt_index"]) == (old["page"], old["receipt_index"])
+        assert new["kind"] == "duplicate_page"
+        assert new["output_index"] is None
+        assert new["duplicate_of"] is not None
+    assert len({r["duplicate_of"] for r in second}) == 4
+
+
+real_detail_difference = dedup_index.detail_difference
+
+
+def template_receipt(serial):
+    """同一模板的回执单：固定的表头和表格，只有流水号和金额不同"""
+    gray = np.full((150, 400), 255, np.uint8)
+    gray[10:30, 20:380] = 0
+    gray[50:51, 20:380] = 0
+    gray[140:141, 20:380] = 0
+    rng = np.random.default_rng(serial)
+    for row in range(2):
+        digits = rng.integers(0, 2, (6, 24), dtype=np.uint8) * 255
+        gray[70 + row * 30:88 + row * 30, 200:272] = np.kron(digits, np.ones((3, 3), np.uint8))
+    return gray
+
+
+@pytest.mark.parametrize("records", [300, 2000])
+def test_same_template_lookups_stay_bounded(tmp_path, monkeypatch, records):
+    index = DedupIndex(str(tmp_path / "dedup.db"), max_candidates=32)
+    fingerprints = {}
+    for serial in range(records):
+        gray = template_receipt(serial)
+        phash, detail = perceptual_hash(gray), detail_signature(gray)
+        fingerprints[serial] = (phash, detail)
+        index.add_receipt(phash, detail, f"page{serial}", "src", serial, 0, "out", serial)
+
+    # 前提：这些回执单的感知哈希都挤在同一处，只靠多索引哈希会把它们全部当作候选
+    new_gray = template_receipt(records)
+    new_phash, new_detail = perceptual_hash(new_gray), detail_signature(new_gray)
+    near = sum(bin(phash ^ new_phash).count("1") <= index.max_distance
+               for phash, _ in fingerprints.values())
+    assert near > index.max_candidates
+
+    compared = []
+    monkeypatch.setattr(dedup_index, "detail_difference",
+                        lambda a, b: compared.append(1) or real_detail_difference(a, b))
+
+    assert index.find_receipt(new_phash, new_detail) is None
+    assert len(compared) <= index.max_candidates
+
+    compared.clear()
+    phash, detail = fingerprints[records // 2]
+    assert index.find_receipt(phash, detail) == records // 2 + 1
+    assert len(compared) == 1
+    index.close()
@@ -0,0 +1,164 @@
+import multiprocessing
+import os
+import sqlite3
+import time
+
+import pytest
+from pypdf import PdfReader
+
+import distributed
+from conftest import make_pdf
+from distributed import (MergeLease, WorkQueue, merge_job, parts_dir_for, run_local_workers,
+                         run_worker)
+
+# 工作进程通过 fork 继承测试中替换掉的检测函数
+pytestmark = pytest.mark.skipif(multiprocessing.get_start_method() != "fork",
+                                reason="需要 fork 启动方式")
+
+
+def page_marks(pdf_path):
+    """输出页面来自原始文件的第几页（测试PDF的内容流中编码了页码）"""
+    marks = []
+    for page in PdfReader(pdf_path).pages:
+        data = page.get_contents().get_data().split()
+        marks.append(int(data[3]) - 1)
+    return marks
+
+
+class StopAfterItems:
+    """所有分片都完成后让工作进程退出，不去合并"""
+
+    def __init__(self, db_path, items):
+        self.db_path = db_path
+        self.items = items
+
+    def is_set(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            done = conn.execute("SELECT COUNT(*) FROM items WHERE status = 'done'").fetchone()[0]
+        finally:
+            conn.close()
+        return done >= self.items
+
+
+def enqueue(tmp_path, names, pages=7, chunk_pages=2, lease_seconds=300):
+    db_path = str(tmp_path / "queue.db")
+    work_queue = WorkQueue(db_path, lease_seconds=lease_seconds)
+    outputs = []
+    for name in names:
+        input_pdf = make_pdf(tmp_path / f"{name}.pdf", pages)
+        output_path = str(tmp_path / "out" / f"{name}_processed.pdf")
+        work_queue.enqueue_file(str(input_pdf), output_path, chunk_pages)
+        outputs.append(output_path)
+    work_queue.close()
+    return db_path, outputs
+
+
+def job_rows(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT status FROM jobs ORDER BY id").fetchall()
+    finally:
+        conn.close()
+
+
+def test_local_workers_process_and_merge_in_page_order(tmp_path, stub_detection):
+    db_path, outputs = enqueue(tmp_path, ["a", "b"])
+    run_local_workers(db_path, 3)
+
+    assert job_rows(db_path) == [("done",), ("done",)]
+    for output_path in outputs:
+        # 每页分成两个回执单，输出按页码顺序排列
+        assert page_marks(output_path) == [n for n in range(7) for _ in range(2)]
+        assert not os.path.exists(parts_dir_for(output_path))
+
+
+def test_expired_lease_is_requeued(tmp_path, stub_detection):
+    db_path, outputs = enqueue(tmp_path, ["a"], lease_seconds=0.2)
+    crashed = WorkQueue(db_path, lease_seconds=0.2)
+    item = crashed.claim("crashed-worker")
+    crashed.close()
+    time.sleep(0.3)
+
+    run_worker(db_path, worker_id="w1", lease_seconds=0.2, poll_interval=0.05)
+
+    conn = sqlite3.connect(db_path)
+    attempts, owner = conn.execute(
+        "SELECT attempts, lease_owner FROM items WHERE id = ?", (item["id"],)
+    ).fetchone()
+    conn.close()
+    assert attempts == 2 and owner is None
+    assert page_marks(outputs[0]) == [n for n in range(7) for _ in range(2)]
+
+
+def test_lease_expiring_too_often_fails_the_job(tmp_path, stub_detection):
+    db_path, _ = enqueue(tmp_path, ["a"], pages=2, lease_seconds=0.1)
+    work_queue = WorkQueue(db_path, lease_seconds=0.1, max_attempts=2)
+    for _ in range(2):
+        assert work_queue.claim("crashed-worker") is not None
+        time.sleep(0.15)
+    assert work_queue.claim("other") is None
+    work_queue.mark_failed_jobs()
+    work_queue.close()
+    assert job_rows(db_path) == [("failed",)]
+
+
+def slow_append(monkeypatch, delay):
+    original = distributed.PdfWriter.append
+
+    def append(self, *args, **kwargs):
+        time.sleep(delay)
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(distributed.PdfWriter, "append", append)
+
+
+def test_merge_lease_is_renewed_during_long_merge(tmp_path, stub_detection, monkeypatch):
+    lease_seconds = 0.6
+    db_path, outputs = enqueue(tmp_path, ["a"], pages=8, chunk_pages=2, lease_seconds=lease_seconds)
+    run_worker(db_path, worker_id="w0", lease_seconds=lease_seconds, exit_when_idle=False,
+               stop_event=StopAfterItems(db_path, 4))
+    # 合并需要约 4 * 0.4 = 1.6 秒，远超租约时长
+    slow_append(monkeypatch, 0.4)
+
+    merger = multiprocessing.Process(
+        target=run_worker, args=(db_path,),
+        kwargs={"worker_id": "merger", "lease_seconds": lease_seconds, "poll_interval": 0.05}
+    )
+    merger.start()
+    other = WorkQueue(db_path, lease_seconds=lease_seconds)
+    # 等合并进程领取合并后，再不断尝试抢占
+    while other.conn.execute("SELECT merge_owner FROM jobs").fetchone()[0] != "merger":
+        time.sleep(0.01)
+    stolen = []
+    while merger.is_alive():
+        merge = other.claim_merge("intruder")
+        if merge is not None:
+            stolen.append(merge)
+        time.sleep(0.05)
+    merger.join()
+    other.close()
+
+    assert stolen == []
+    assert job_rows(db_path) == [("done",)]
+    assert page_marks(outputs[0]) == [n for n in range(8) for _ in range(2)]
+
+
+def test_merge_stops_when_lease_is_lost(tmp_path, stub_detection):
+    db_path, outputs = enqueue(tmp_path, ["a"], pages=4, chunk_pages=2)
+    run_worker(db_path, worker_id="w0", exit_when_idle=False,
+               stop_event=StopAfterItems(db_path, 2))
+    work_queue = WorkQueue(db_path)
+    job, items = work_queue.claim_merge("slow")
+    # 模拟租约过期后被另一个进程领走
+    work_queue.conn.execute("UPDATE jobs SET merge_owner = 'other' WHERE id = ?", (job["id"],))
+
+    with MergeLease(db_path, job["id"], "slow", 0.15) as lease:
+        time.sleep(0.2)
+        assert not lease.is_owner()
+        assert merge_job(job, items, "slow", lease.is_owner) is False
+    work_queue.close()
+
+    assert not (tmp_path / "out" / "a_processed.pdf").exists()
+    assert all(os.path.exists(item["part_path"]) for item in items)
+    assert list((tmp_path / "out").glob("*.part")) == []
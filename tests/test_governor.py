@@ -0,0 +1,190 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+import governor
+from governor import AdjustableSemaphore, ConcurrencyGovernor, ResourceSampler, proc_descendants
+
+MB = 1024 * 1024
+
+
+class FakeSampler:
+    def __init__(self, rss_mb=100, cpu=0.5):
+        self.rss_mb = rss_mb
+        self.cpu = cpu
+
+    def rss_bytes(self, pids=()):
+        return self.rss_mb * MB
+
+    def cpu_fraction(self):
+        return self.cpu
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_governor(**kwargs):
+    sampler, clock = FakeSampler(), FakeClock()
+    options = {"min_workers": 1, "max_workers": 4, "memory_limit_mb": 1000, "cooldown": 3.0}
+    options.update(kwargs)
+    return ConcurrencyGovernor(sampler=sampler, clock=clock, **options), sampler, clock
+
+
+def acquire_in_thread(semaphore):
+    acquired = threading.Event()
+    thread = threading.Thread(target=lambda: (semaphore.acquire(), acquired.set()), daemon=True)
+    thread.start()
+    return acquired
+
+
+def test_semaphore_blocks_at_limit_until_release():
+    semaphore = AdjustableSemaphore(2)
+    semaphore.acquire()
+    semaphore.acquire()
+    acquired = acquire_in_thread(semaphore)
+    assert not acquired.wait(0.1)
+
+    semaphore.release()
+    assert acquired.wait(1)
+    assert semaphore.in_use == 2
+
+
+def test_raising_limit_wakes_waiters():
+    semaphore = AdjustableSemaphore(1)
+    semaphore.acquire()
+    acquired = acquire_in_thread(semaphore)
+    assert not acquired.wait(0.1)
+
+    semaphore.set_limit(2)
+    assert acquired.wait(1)
+
+
+def test_lowering_limit_keeps_holders_and_blocks_new():
+    semaphore = AdjustableSemaphore(3)
+    for _ in range(3):
+        semaphore.acquire()
+    semaphore.set_limit(1)
+    assert semaphore.in_use == 3
+
+    acquired = acquire_in_thread(semaphore)
+    semaphore.release()
+    semaphore.release()
+    assert not acquired.wait(0.1)  # 还有1个在用，已达新上限
+    semaphore.release()
+    assert acquired.wait(1)
+
+
+def test_memory_pressure_throttles_pages_when_workers_are_at_minimum():
+    gov, sampler, clock = make_governor(min_workers=2)
+    assert (gov.target_workers, gov.page_gate.limit) == (2, 2)
+
+    sampler.rss_mb = 950
+    decision = gov.update(queue_depth=5, active_workers=2)
+    assert decision.action == "throttle"
+    assert (gov.target_workers, gov.page_gate.limit) == (2, 1)
+
+
+def test_memory_pressure_scales_down():
+    gov, sampler, clock = make_governor()
+    sampler.rss_mb = 950
+    decision = gov.update(queue_depth=5, active_workers=2)
+    assert decision.action == "scale_down"
+    assert (gov.target_workers, gov.page_gate.limit) == (1, 1)
+    assert decision.rss_mb == 950
+
+
+def test_pages_are_released_when_memory_recovers():
+    gov, sampler, clock = make_governor(min_workers=2)
+    sampler.rss_mb = 950
+    gov.update(queue_depth=5, active_workers=2)
+
+    sampler.rss_mb = 800  # 介于 RELAX 与 HIGH 之间：维持
+    decision = gov.update(queue_depth=5, active_workers=2)
+    assert decision.action == "hold"
+    assert gov.page_gate.limit == 1
+
+    sampler.rss_mb = 500
+    assert gov.update(queue_depth=5, active_workers=2).action == "release"
+    assert gov.page_gate.limit == 2
+
+
+def test_scale_up_respects_cooldown_and_max():
+    gov, sampler, clock = make_governor(max_workers=3)
+    sampler.cpu = 0.2
+
+    assert gov.update(queue_depth=5, active_workers=2).action == "scale_up"
+    assert (gov.target_workers, gov.page_gate.limit) == (3, 3)
+
+    gov.max_workers = 4
+    clock.now += 1.0
+    assert gov.update(queue_depth=5, active_workers=3).action == "hold"  # 冷却中
+    clock.now += 2.0
+    assert gov.update(queue_depth=5, active_workers=3).action == "scale_up"
+    clock.now += 3.0
+    assert gov.update(queue_depth=5, active_workers=4).action == "hold"  # 已到上限
+    assert gov.target_workers == 4
+
+
+@pytest.mark.parametrize("cpu, queue_depth, active_workers", [
+    (0.95, 5, 2),   # CPU 已经忙
+    (0.2, 0, 2),    # 没有等待的任务
+    (0.2, 5, 1),    # 已有的工作数还没用满
+])
+def test_no_scale_up_without_reason(cpu, queue_depth, active_workers):
+    gov, sampler, clock = make_governor()
+    sampler.cpu = cpu
+    assert gov.update(queue_depth, active_workers).action == "hold"
+    assert gov.target_workers == 2
+
+
+def test_max_inflight_pages_caps_page_gate():
+    gov, sampler, clock = make_governor(max_workers=8, max_inflight_pages=2, cooldown=0)
+    sampler.cpu = 0.1
+    for _ in range(4):
+        gov.update(queue_depth=10, active_workers=gov.target_workers)
+    assert gov.target_workers == 6
+    assert gov.page_gate.limit == 2
+
+
+def test_metrics_log_only_records_changes(tmp_path):
+    metrics_path = tmp_path / "metrics.jsonl"
+    gov, sampler, clock = make_governor(metrics_path=str(metrics_path))
+    gov.update(queue_depth=0, active_workers=2)
+    sampler.rss_mb = 950
+    gov.update(queue_depth=0, active_workers=2)
+    gov.update(queue_depth=0, active_workers=1)
+
+    lines = [json.loads(line) for line in metrics_path.read_text(encoding="utf-8").splitlines()]
+    assert [line["action"] for line in lines] == ["scale_down"]
+    metrics = gov.metrics()
+    assert metrics["counters"]["hold"] == 2
+    assert metrics["peak_rss_mb"] == 950
+    assert metrics["last_decision"]["action"] == "hold"
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/stat"), reason="需要 /proc")
+def test_proc_fallback_counts_child_processes(monkeypatch):
+    monkeypatch.setattr(governor, "psutil", None)
+    sampler = ResourceSampler()
+    before = sampler.rss_bytes()
+
+    child = subprocess.Popen([sys.executable, "-c",
+                              "import sys, time; data = bytearray(64 << 20); "
+                              "print('ready', flush=True); time.sleep(30)"],
+                             stdout=subprocess.PIPE, text=True)
+    try:
+        assert child.stdout.readline().strip() == "ready"
+        assert child.pid in proc_descendants(os.getpid())
+        assert sampler.rss_bytes() - before > 48 * MB
+    finally:
+        child.kill()
+        child.wait()
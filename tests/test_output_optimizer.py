@@ -0,0 +1,137 @@
+import sys
+
+import pytest
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import ArrayObject, DecodedStreamObject, DictionaryObject, NameObject, NumberObject
+
+from output_optimizer import (PRESETS, OutputOptions, format_report, remove_unused_resources,
+                              used_resource_names, write_pdf)
+
+
+def make_stream(writer, data, **entries):
+    stream = DecodedStreamObject()
+    stream.set_data(data)
+    stream.update({NameObject(key): value for key, value in entries.items()})
+    return writer._add_object(stream)
+
+
+def make_image(writer, seed):
+    data = bytes((seed * 7 + i * 13) % 256 for i in range(100 * 100))
+    return make_stream(writer, data, **{
+        "/Type": NameObject("/XObject"), "/Subtype": NameObject("/Image"),
+        "/Width": NumberObject(100), "/Height": NumberObject(100),
+        "/ColorSpace": NameObject("/DeviceGray"), "/BitsPerComponent": NumberObject(8),
+    })
+
+
+def shared_resources_writer():
+    """两页共享一个资源字典：第0页用 F1 和 Im0，第1页用 F2、Im1 和 GS0"""
+    writer = PdfWriter()
+    font = DictionaryObject({NameObject("/Type"): NameObject("/Font"),
+                             NameObject("/Subtype"): NameObject("/Type1"),
+                             NameObject("/BaseFont"): NameObject("/Helvetica")})
+    resources = writer._add_object(DictionaryObject({
+        NameObject("/Font"): DictionaryObject({
+            NameObject("/F1"): writer._add_object(font),
+            NameObject("/F2"): writer._add_object(font.clone(writer)),
+        }),
+        NameObject("/XObject"): DictionaryObject({NameObject("/Im0"): make_image(writer, 0),
+                                                  NameObject("/Im1"): make_image(writer, 1)}),
+        NameObject("/ExtGState"): DictionaryObject({NameObject("/GS0"): DictionaryObject()}),
+        NameObject("/ColorSpace"): DictionaryObject({NameObject("/CS0"): NameObject("/DeviceRGB")}),
+        NameObject("/ProcSet"): ArrayObject([NameObject("/PDF"), NameObject("/Text")]),
+    }))
+    contents = [b"BT /F1 12 Tf (a) Tj ET q 100 0 0 100 0 0 cm /Im0 Do Q",
+                b"/GS0 gs BT /F2 12 Tf (b) Tj ET q 100 0 0 100 0 0 cm /Im1 Do Q"]
+    for data in contents:
+        page = writer.add_blank_page(612, 792)
+        page[NameObject("/Resources")] = resources
+        page[NameObject("/Contents")] = make_stream(writer, data)
+    return writer
+
+
+def repeated_page_writer(copies=4):
+    """每页各带一份内容相同的图像和内容流，与多个回执单来自同一扫描页时的输出类似"""
+    writer = PdfWriter()
+    for _ in range(copies):
+        page = writer.add_blank_page(612, 792)
+        page[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/XObject"): DictionaryObject({NameObject("/Im0"): make_image(writer, 0)})
+        })
+        page[NameObject("/Contents")] = make_stream(writer, b"q 612 0 0 792 0 0 cm /Im0 Do Q")
+    return writer
+
+
+def test_used_resource_names():
+    page = shared_resources_writer().pages[1]
+    assert used_resource_names(page) == {"/XObject": {"/Im1"}, "/Font": {"/F2"},
+                                         "/ExtGState": {"/GS0"}}
+
+
+def test_remove_unused_resources_leaves_shared_dict_alone():
+    writer = shared_resources_writer()
+    first, second = writer.pages
+    shared = second["/Resources"]
+
+    assert remove_unused_resources(first) == 3  # F2、Im1、GS0
+
+    pruned = first["/Resources"]
+    assert sorted(pruned["/Font"]) == ["/F1"]
+    assert sorted(pruned["/XObject"]) == ["/Im0"]
+    assert len(pruned["/ExtGState"]) == 0
+    # 内容流用不到的类别原样保留
+    assert list(pruned["/ProcSet"]) == ["/PDF", "/Text"]
+    assert sorted(pruned["/ColorSpace"]) == ["/CS0"]
+    # 第1页仍然使用原来的共享字典，没有被改动
+    assert second["/Resources"] is shared
+    assert sorted(shared.get_object()["/Font"]) == ["/F1", "/F2"]
+
+
+def test_remove_unused_resources_without_resources():
+    page = PdfWriter().add_blank_page(100, 100)
+    assert remove_unused_resources(page) == 0
+
+
+def test_none_preset_writes_plain_output(tmp_path):
+    report = write_pdf(repeated_page_writer(), str(tmp_path / "out.pdf"), "none")
+    assert set(report) == {"output_bytes", "seconds"}
+    assert report["output_bytes"] == (tmp_path / "out.pdf").stat().st_size
+    default = write_pdf(repeated_page_writer(), str(tmp_path / "default.pdf"))
+    assert default["output_bytes"] == report["output_bytes"]
+
+
+def test_fast_preset_merges_identical_objects(tmp_path):
+    plain = write_pdf(repeated_page_writer(), str(tmp_path / "plain.pdf"), "none")
+    fast = write_pdf(repeated_page_writer(), str(tmp_path / "fast.pdf"),
+                     PRESETS["fast"].replace(measure_baseline=True))
+
+    assert "dedupe_seconds" in fast
+    assert fast["baseline_bytes"] == pytest.approx(plain["output_bytes"], rel=0.05)
+    assert fast["output_bytes"] < plain["output_bytes"] / 2
+    assert len(PdfReader(str(tmp_path / "fast.pdf")).pages) == 4
+
+
+def test_max_preset_without_pikepdf(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "pikepdf", None)  # import pikepdf 抛出 ImportError
+    report = write_pdf(shared_resources_writer(), str(tmp_path / "max.pdf"), "max")
+
+    assert report["object_streams"] is False
+    assert report["removed_resources"] == 5  # 第0页 F2、Im1、GS0，第1页 F1、Im0
+    assert {"remove_unused_resources_seconds", "recompress_seconds", "dedupe_seconds",
+            "object_streams_seconds", "output_bytes", "seconds"} <= set(report)
+    assert "未安装 pikepdf" in format_report(report)
+
+    reader = PdfReader(str(tmp_path / "max.pdf"))
+    assert len(reader.pages) == 2
+    assert sorted(reader.pages[0]["/Resources"]["/XObject"]) == ["/Im0"]
+    assert sorted(reader.pages[1]["/Resources"]["/XObject"]) == ["/Im1"]
+
+
+def test_format_report_with_baseline():
+    text = format_report({"output_bytes": 512, "baseline_bytes": 2048, "seconds": 0.5})
+    assert "未优化 2.0 KB" in text
+    assert "25%" in text
+
+
+def test_options_default_to_no_optimization():
+    assert PRESETS["none"] == OutputOptions()
@@ -0,0 +1,157 @@
+import pytest
+from pypdf import PdfReader
+
+import split_pdf_opencv
+from conftest import make_pdf
+from page_loader import LazyPageTree, parse_page_ranges
+
+
+def write_raw_pdf(path, objects):
+    """按对象编号顺序写出PDF（objects[0] 是1号对象，必须是 /Catalog）"""
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for num, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{num} 0 obj\n{body}\nendobj\n".encode()
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    path.write_bytes(bytes(out))
+    return str(path)
+
+
+def stream(data):
+    return f"<< /Length {len(data)} >>\nstream\n{data}\nendstream"
+
+
+def make_nested_pdf(path, inner_count=2):
+    """
+    多层页面树，属性从不同层级继承：
+
+        2 根节点 (MediaBox 600x800, Rotate 90)
+        ├── 3 (Resources F1)：第0、1页
+        └── 4 (MediaBox 300x400)：第2页，以及
+            └── 5：第3页，第4页（自带 MediaBox 和 Rotate 0）
+    """
+    return write_raw_pdf(path, [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [3 0 R 4 0 R] /Count 5 /MediaBox [0 0 600 800] /Rotate 90 >>",
+        "<< /Type /Pages /Parent 2 0 R /Kids [6 0 R 7 0 R] /Count 2 "
+        "/Resources << /Font << /F1 11 0 R >> >> >>",
+        "<< /Type /Pages /Parent 2 0 R /Kids [8 0 R 5 0 R] /Count 3 /MediaBox [0 0 300 400] >>",
+        f"<< /Type /Pages /Parent 4 0 R /Kids [9 0 R 10 0 R] /Count {inner_count} >>",
+        "<< /Type /Page /Parent 3 0 R /Contents 12 0 R >>",
+        "<< /Type /Page /Parent 3 0 R /Contents 13 0 R >>",
+        "<< /Type /Page /Parent 4 0 R /Contents 14 0 R >>",
+        "<< /Type /Page /Parent 5 0 R /Contents 15 0 R >>",
+        "<< /Type /Page /Parent 5 0 R /Contents 16 0 R /MediaBox [0 0 100 100] /Rotate 0 >>",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        *(stream(f"0 0 m {page_num + 1} 10 l S") for page_num in range(5)),
+    ])
+
+
+def page_summary(page):
+    resources = page.get("/Resources")
+    fonts = sorted(resources.get_object().get("/Font", {})) if resources is not None else []
+    return (list(page.mediabox), page.rotation, fonts, page.get_contents().get_data())
+
+
+@pytest.mark.parametrize("inner_count", [2, 1])
+def test_lazy_pages_match_pypdf(tmp_path, inner_count):
+    # inner_count=1 时 /Count 与实际子节点数不符，应退回 pypdf 的完整展开
+    input_pdf = make_nested_pdf(tmp_path / "nested.pdf", inner_count)
+    reader = PdfReader(input_pdf)
+    with LazyPageTree(input_pdf) as page_tree:
+        assert page_tree.page_count == len(reader.pages) == 5
+        for page_num in range(5):
+            assert page_summary(page_tree.get_page(page_num)) == page_summary(reader.pages[page_num])
+        assert page_tree.get_page(4) is page_tree.get_page(4)
+
+
+@pytest.mark.parametrize("order", ["sequential", "reversed"])
+def test_flat_tree_is_walked_in_linear_time(tmp_path, order):
+    pages = 3000
+    with LazyPageTree(make_pdf(tmp_path / "flat.pdf", pages)) as page_tree:
+        reads = []
+        get_object = page_tree.reader.get_object
+
+        def counting_get_object(indirect_reference):
+            reads.append(indirect_reference)
+            return get_object(indirect_reference)
+
+        page_tree.reader.get_object = counting_get_object
+        page_nums = range(pages) if order == "sequential" else reversed(range(pages))
+        for page_num in page_nums:
+            page_tree.get_page(page_num)
+
+    # 每页只读取固定几个对象；逐页从头扫描 /Kids 则需要约 pages²/2 次
+    assert len(reads) <= 5 * pages
+
+
+def test_lazy_page_out_of_range(tmp_path):
+    with LazyPageTree(make_pdf(tmp_path / "in.pdf", 3)) as page_tree:
+        with pytest.raises(IndexError):
+            page_tree.get_page(3)
+        with pytest.raises(IndexError):
+            page_tree.get_page(-1)
+
+
+@pytest.mark.parametrize("spec, expected", [
+    ("1", [0]),
+    ("1-3,5", [0, 1, 2, 4]),
+    ("8-", [7, 8, 9]),
+    ("-2", [0, 1]),
+    (" 3 , 1-2 ,, 2 ", [0, 1, 2]),
+    ("9-20", [8, 9]),
+])
+def test_parse_page_ranges(spec, expected):
+    assert parse_page_ranges(spec, 10) == expected
+
+
+@pytest.mark.parametrize("spec", ["a", "1-x", "0", "5-3", "11", "12-"])
+def test_parse_page_ranges_rejects_invalid(spec):
+    with pytest.raises(ValueError):
+        parse_page_ranges(spec, 10)
+
+
+@pytest.fixture
+def opened_trees(monkeypatch):
+    """记录 process_pdf_with_opencv 打开的所有 LazyPageTree"""
+    trees = []
+
+    class RecordingPageTree(LazyPageTree):
+        def __init__(self, input_pdf):
+            super().__init__(input_pdf)
+            trees.append(self)
+
+    monkeypatch.setattr(split_pdf_opencv, "LazyPageTree", RecordingPageTree)
+    return trees
+
+
+def test_file_is_closed_when_sidecar_extension_is_invalid(tmp_path, opened_trees):
+    input_pdf = make_pdf(tmp_path / "in.pdf", 2)
+    with pytest.raises(ValueError):
+        split_pdf_opencv.process_pdf_with_opencv(str(input_pdf), str(tmp_path / "out.pdf"),
+                                                 sidecar_path=str(tmp_path / "receipts.csv"))
+    assert len(opened_trees) == 1
+    assert opened_trees[0].file.closed
+
+
+def test_file_is_closed_when_page_filter_fails(tmp_path, opened_trees):
+    input_pdf = make_pdf(tmp_path / "in.pdf", 2)
+
+    def page_filter(page_num, page):
+        raise RuntimeError("筛选失败")
+
+    with pytest.raises(RuntimeError):
+        split_pdf_opencv.process_pdf_with_opencv(str(input_pdf), str(tmp_path / "out.pdf"),
+                                                 page_filter=page_filter)
+    assert opened_trees[0].file.closed
+
+
+def test_file_is_closed_after_processing(tmp_path, opened_trees, stub_detection):
+    input_pdf = make_pdf(tmp_path / "in.pdf", 2)
+    split_pdf_opencv.process_pdf_with_opencv(str(input_pdf), str(tmp_path / "out.pdf"))
+    assert opened_trees[0].file.closed
@@ -0,0 +1,73 @@
+import pytest
+from PIL import Image
+from pypdf import PdfReader, PdfWriter
+
+import split_pdf_opencv
+from governor import AdjustableSemaphore
+from split_pdf_opencv import DEFAULT_CONFIG, PageRenderer, process_pdf_with_opencv
+
+
+@pytest.fixture
+def render_calls(monkeypatch):
+    """记录 render_page_range 的调用，返回与页面尺寸相符的白色图像"""
+    calls = []
+
+    def render_page_range(input_pdf, first_page, last_page, dpi, grayscale=False, use_cropbox=False):
+        calls.append((str(input_pdf), first_page, last_page, dpi))
+        reader = PdfReader(input_pdf)
+        images = []
+        for page_num in range(first_page, last_page + 1):
+            box = reader.pages[page_num].cropbox if use_cropbox else reader.pages[page_num].mediabox
+            size = (max(1, int(float(box.width) * dpi / 72)), max(1, int(float(box.height) * dpi / 72)))
+            images.append(Image.new("L" if grayscale else "RGB", size, "white"))
+        return images
+
+    monkeypatch.setattr(split_pdf_opencv, "render_page_range", render_page_range)
+    return calls
+
+
+def make_pdf_with_tall_page(path, pages=7, tall_page=6):
+    writer = PdfWriter()
+    for page_num in range(pages):
+        writer.add_blank_page(612, 792 * 8 if page_num == tall_page else 792)
+    with open(path, "wb") as f:
+        writer.write(f)
+    return str(path)
+
+
+def test_batches_grow_while_every_image_is_used(tmp_path, render_calls):
+    input_pdf = make_pdf_with_tall_page(tmp_path / "in.pdf", pages=8, tall_page=99)
+    renderer = PageRenderer(input_pdf, range(8), max_batch=4)
+    for page_num in range(8):
+        renderer.render(page_num, 100)
+    assert [(first, last) for _, first, last, _ in render_calls] == [(0, 0), (1, 2), (3, 6), (7, 7)]
+
+
+def test_unused_prefetch_resets_batch(tmp_path, render_calls):
+    input_pdf = make_pdf_with_tall_page(tmp_path / "in.pdf", pages=8, tall_page=99)
+    renderer = PageRenderer(input_pdf, range(8), max_batch=4)
+    for page_num in (0, 1, 4, 5):  # 第2、3页没有用到
+        renderer.render(page_num, 100)
+    assert [(first, last) for _, first, last, _ in render_calls] == [(0, 0), (1, 2), (4, 4), (5, 6)]
+
+
+def test_tall_pages_are_never_prefetched(tmp_path, render_calls):
+    input_pdf = make_pdf_with_tall_page(tmp_path / "in.pdf")
+    config = DEFAULT_CONFIG.replace(quick_skip=False)
+    process_pdf_with_opencv(input_pdf, str(tmp_path / "out.pdf"), config=config)
+
+    full_renders = [(first, last) for path, first, last, dpi in render_calls
+                    if path == input_pdf and dpi == config.dpi]
+    assert full_renders
+    assert all(last < 6 for first, last in full_renders)
+
+
+def test_page_gate_disables_full_resolution_prefetch(tmp_path, render_calls):
+    input_pdf = make_pdf_with_tall_page(tmp_path / "in.pdf", pages=8, tall_page=99)
+    config = DEFAULT_CONFIG.replace(quick_skip=False)
+    process_pdf_with_opencv(input_pdf, str(tmp_path / "out.pdf"), config=config,
+                            page_gate=AdjustableSemaphore(1))
+
+    full_renders = [(first, last) for _, first, last, dpi in render_calls if dpi == config.dpi]
+    assert len(full_renders) == 8
+    assert all(first == last for first, last in full_renders)
@@ -0,0 +1,79 @@
+from progress import ProgressTracker, format_duration
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_tracker(interval=1.0):
+    clock = FakeClock()
+    events = []
+    tracker = ProgressTracker(event_callback=events.append, interval=interval, clock=clock)
+    return tracker, clock, events
+
+
+def test_page_updates_are_throttled():
+    tracker, clock, events = make_tracker(interval=1.0)
+    tracker.start(100, "in.pdf")
+    for _ in range(10):
+        clock.now += 0.3
+        tracker.page_done(receipts=2)
+
+    # 0.9 秒之前的页面被合并，之后每隔至少 1 秒发送一次
+    pages = [event for event in events if event.stage == "page"]
+    assert [event.pages_done for event in pages] == [4, 8]
+    assert pages[-1].receipts == 16
+    assert [event.stage for event in events] == ["start", "page", "page"]
+
+
+def test_start_saving_and_finish_are_always_sent():
+    tracker, clock, events = make_tracker(interval=10.0)
+    tracker.start(2)
+    tracker.page_done()
+    tracker.page_done()
+    tracker.saving("out.pdf")
+    tracker.finish("out.pdf")
+    assert [event.stage for event in events] == ["start", "saving", "done"]
+    assert [event.percent for event in events] == [0, 99, 100]
+
+
+def test_throughput_and_eta():
+    tracker, clock, events = make_tracker(interval=0.0)
+    tracker.start(10)
+    clock.now = 2.0
+    tracker.page_done()
+    tracker.page_done()
+
+    event = events[-1]
+    assert event.pages_per_sec == 1.0
+    assert event.eta == 8.0
+    assert "剩余约 8 秒" in event.message
+
+
+def test_legacy_callback_receives_percent_and_message():
+    calls = []
+    tracker = ProgressTracker(lambda percent, message: calls.append((percent, message)),
+                              interval=0.0, clock=FakeClock())
+    tracker.start(4, "in.pdf")
+    tracker.page_done(receipts=3)
+    assert calls[0] == (0, "正在处理PDF: in.pdf，总页数: 4")
+    assert calls[1][0] == 25
+    assert "已找到 3 个回执单" in calls[1][1]
+
+
+def test_disabled_tracker_sends_nothing():
+    tracker = ProgressTracker(clock=FakeClock())
+    assert not tracker.enabled
+    tracker.start(1)
+    tracker.page_done()
+    tracker.finish()
+
+
+def test_format_duration():
+    assert format_duration(59.4) == "59 秒"
+    assert format_duration(125) == "2 分 5 秒"
+    assert format_duration(3 * 3600 + 61) == "3 小时 1 分"
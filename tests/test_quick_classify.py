@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+from PIL import Image
+from pypdf import PdfWriter
+from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+import split_pdf_opencv
+from page_loader import LazyPageTree
+from split_pdf_opencv import DEFAULT_CONFIG, analyze_page, quick_classify_page
+
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792
+
+
+def draw_receipt(image, top, bottom):
+    """在 [top, bottom) 行之间画一张白底、有多行文字的回执单"""
+    height, width = image.shape
+    image[top:bottom, width // 10:width * 9 // 10] = 255
+    draw_text(image, top + height // 50, bottom - height // 50)
+
+
+def draw_text(image, top, bottom):
+    """用竖直笔画模拟文字，缩略图上每一行都有墨迹"""
+    width = image.shape[1]
+    stroke = max(1, width // 150)
+    for x in range(width // 5, width * 7 // 10, 6 * stroke):
+        image[top:bottom, x:x + stroke] = 0
+
+
+def scan_two_receipts(height, width):
+    """灰色扫描底板上的两张回执单"""
+    image = np.full((height, width), 150, np.uint8)
+    draw_receipt(image, height * 5 // 100, height * 47 // 100)
+    draw_receipt(image, height * 53 // 100, height * 95 // 100)
+    return image
+
+
+def tinted_single_receipt(height, width):
+    """淡黄色（灰度180）纸上打印的一张回执单"""
+    image = np.full((height, width), 180, np.uint8)
+    draw_text(image, height // 20, height * 19 // 20)
+    return image
+
+
+def white_single_receipt(height, width):
+    image = np.full((height, width), 255, np.uint8)
+    draw_receipt(image, height // 20, height * 19 // 20)
+    return image
+
+
+@pytest.fixture
+def page_image(monkeypatch):
+    """用 page_image.draw(高, 宽) 生成的图像代替 pdftoppm 渲染"""
+    class Stub:
+        draw = None
+
+    def render_page_range(input_pdf, first_page, last_page, dpi, grayscale=False, use_cropbox=False):
+        size = (int(PAGE_WIDTH * dpi / 72), int(PAGE_HEIGHT * dpi / 72))
+        images = []
+        for _ in range(first_page, last_page + 1):
+            image = Image.fromarray(Stub.draw(size[1], size[0]))
+            images.append(image if grayscale else image.convert("RGB"))
+        return images
+
+    monkeypatch.setattr(split_pdf_opencv, "render_page_range", render_page_range)
+    return Stub
+
+
+def make_page(tmp_path, with_image):
+    writer = PdfWriter()
+    page = writer.add_blank_page(PAGE_WIDTH, PAGE_HEIGHT)
+    stream = DecodedStreamObject()
+    stream.set_data(b"q 612 0 0 792 0 0 cm /Im0 Do Q" if with_image else b"0 0 m 10 10 l S")
+    page[NameObject("/Contents")] = writer._add_object(stream)
+    if with_image:
+        image = DecodedStreamObject()
+        image.set_data(b"\x00")
+        image.update({NameObject("/Type"): NameObject("/XObject"),
+                      NameObject("/Subtype"): NameObject("/Image")})
+        page[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/XObject"): DictionaryObject({NameObject("/Im0"): writer._add_object(image)})
+        })
+    path = tmp_path / "in.pdf"
+    with open(path, "wb") as f:
+        writer.write(f)
+    return str(path)
+
+
+def classify(input_pdf):
+    with LazyPageTree(input_pdf) as page_tree:
+        page = page_tree.get_page(0)
+        verdict, _ = quick_classify_page(input_pdf, 0, page, DEFAULT_CONFIG)
+        return verdict, analyze_page(input_pdf, 0, page, DEFAULT_CONFIG)
+
+
+def test_two_receipts_on_gray_scan_go_through_full_detection(tmp_path, page_image):
+    page_image.draw = scan_two_receipts
+    verdict, analysis = classify(make_page(tmp_path, with_image=True))
+    assert verdict is None
+    assert analysis.kind == "split"
+    assert len(analysis.boxes) == 2
+
+
+def test_tinted_paper_is_not_fast_single(tmp_path, page_image):
+    page_image.draw = tinted_single_receipt
+    verdict, analysis = classify(make_page(tmp_path, with_image=False))
+    assert verdict is None
+    assert analysis.kind != "fast_single"
+
+
+@pytest.mark.parametrize("with_image", [False, True])
+def test_single_receipt_on_white_paper_is_fast_single(tmp_path, page_image, with_image):
+    page_image.draw = white_single_receipt
+    verdict, analysis = classify(make_page(tmp_path, with_image))
+    assert verdict == "single"
+    assert analysis.kind == "fast_single"
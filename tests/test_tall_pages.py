@@ -0,0 +1,134 @@
+import numpy as np
+import pytest
+from PIL import Image
+from pypdf import PdfReader, PdfWriter
+
+import split_pdf_opencv
+from page_loader import LazyPageTree
+from split_pdf_opencv import DEFAULT_CONFIG, analyze_page, detect_tall_page_regions, merge_intervals
+
+# 72 DPI 下1个PDF点即1个像素；条带 400 像素高、相互重叠 64 像素
+CONFIG = DEFAULT_CONFIG.replace(dpi=72, tile_height_px=400, tile_overlap_px=64, quick_skip=False)
+PAGE_WIDTH, PAGE_HEIGHT = 300, 3000
+
+# (top, bottom)：第二张横跨 672/736 和 1008/1072 两处条带接缝，第三张比一条条带还高
+RECEIPTS = [(100, 600), (700, 1300), (2000, 2500)]
+
+
+def draw_receipt(image, top, bottom):
+    """带边框和多行文字的回执单"""
+    left, right = 30, 270
+    image[top:bottom, left:right] = 255
+    image[top:top + 3, left:right] = 0
+    image[bottom - 3:bottom, left:right] = 0
+    image[top:bottom, left:left + 3] = 0
+    image[top:bottom, right - 3:right] = 0
+    # 72 DPI 下约 8 点高的文字行，行距 14 点
+    for y in range(top + 20, bottom - 20, 14):
+        image[y:y + 8, left + 20:left + 160] = 0
+
+
+def tall_scroll():
+    image = np.full((PAGE_HEIGHT, PAGE_WIDTH), 255, np.uint8)
+    for top, bottom in RECEIPTS:
+        draw_receipt(image, top, bottom)
+    image[1600:1700, 20:60] = 0            # 太窄（小于页宽的 tile_min_width_ratio）
+    image[1800:1806, 20:280] = 0           # 太矮（小于页宽的 tile_min_height_ratio）
+    return image
+
+
+@pytest.fixture
+def band_renders(monkeypatch):
+    """按条带页面的裁剪框从整页合成图像中切出对应的行，并记录每条条带的行范围"""
+    full = tall_scroll()
+    bands = []
+
+    def render_page_range(input_pdf, first_page, last_page, dpi, grayscale=False, use_cropbox=False):
+        assert dpi == 72 and use_cropbox
+        reader = PdfReader(input_pdf)
+        images = []
+        for page_num in range(first_page, last_page + 1):
+            page = reader.pages[page_num]
+            top = int(round(float(page.mediabox.top) - float(page.cropbox.top)))
+            bottom = int(round(float(page.mediabox.top) - float(page.cropbox.bottom)))
+            bands.append((top, bottom))
+            images.append(Image.fromarray(full[top:bottom]))
+        return images
+
+    monkeypatch.setattr(split_pdf_opencv, "render_page_range", render_page_range)
+    return bands
+
+
+@pytest.fixture
+def tall_pdf(tmp_path):
+    writer = PdfWriter()
+    writer.add_blank_page(PAGE_WIDTH, PAGE_HEIGHT)
+    path = tmp_path / "scroll.pdf"
+    with open(path, "wb") as f:
+        writer.write(f)
+    return str(path)
+
+
+def test_bands_cover_page_with_overlap(tall_pdf, band_renders):
+    with LazyPageTree(tall_pdf) as page_tree:
+        detect_tall_page_regions(tall_pdf, 0, page_tree.get_page(0), CONFIG)
+
+    assert band_renders[0][0] == 0
+    assert band_renders[-1][1] == PAGE_HEIGHT
+    assert all(bottom - top <= CONFIG.tile_height_px for top, bottom in band_renders)
+    for (_, previous_bottom), (top, _) in zip(band_renders, band_renders[1:]):
+        assert previous_bottom - top == CONFIG.tile_overlap_px
+
+
+def test_receipts_are_found_across_seams(tall_pdf, band_renders):
+    with LazyPageTree(tall_pdf) as page_tree:
+        regions, image_size, thumb = detect_tall_page_regions(
+            tall_pdf, 0, page_tree.get_page(0), CONFIG)
+
+    assert image_size == (PAGE_WIDTH, PAGE_HEIGHT)
+    # 每张回执单恰好对应一个区域（跨接缝的没有被切开），过窄和过矮的内容被过滤
+    assert len(regions) == len(RECEIPTS)
+    for (y, h), (top, bottom) in zip(regions, RECEIPTS):
+        assert y <= top and y + h >= bottom
+        # 只多出边距和 boundary_padding，没有把相邻的空白或其它内容带进来
+        assert h <= (bottom - top) * (1 + 2 * CONFIG.margin_ratio) + 2 * CONFIG.boundary_padding + 2
+    for (y0, h0), (y1, _) in zip(regions, regions[1:]):
+        assert y0 + h0 <= y1
+
+
+def test_thumbnail_is_stitched_without_overlap(tall_pdf, band_renders):
+    with LazyPageTree(tall_pdf) as page_tree:
+        _, _, thumb = detect_tall_page_regions(tall_pdf, 0, page_tree.get_page(0), CONFIG,
+                                               thumbnail_width=150)
+
+    assert thumb.shape[1] == 150
+    assert abs(thumb.shape[0] - PAGE_HEIGHT // 2) <= len(band_renders)
+    # 缩略图的行与整页位置对应：回执单之间的空白仍在原处
+    rows = thumb.mean(axis=1)
+    assert rows[1900 // 2] == 255
+    assert rows[(700 + 1300) // 4] < 255
+
+
+def test_analyze_page_splits_tall_page(tall_pdf, band_renders):
+    with LazyPageTree(tall_pdf) as page_tree:
+        analysis = analyze_page(tall_pdf, 0, page_tree.get_page(0), CONFIG)
+
+    assert analysis.kind == "split"
+    assert len(analysis.boxes) == len(RECEIPTS)
+    for box, (top, bottom) in zip(analysis.boxes, RECEIPTS):
+        # PDF坐标原点在左下角
+        assert box.pdf_y <= PAGE_HEIGHT - bottom
+        assert box.pdf_y + box.pdf_h >= PAGE_HEIGHT - top
+
+
+@pytest.mark.parametrize("intervals, max_gap, expected", [
+    ([], 5, []),
+    ([(0, 10)], 5, [(0, 10)]),
+    ([(20, 30), (0, 10)], 5, [(0, 10), (20, 30)]),
+    ([(0, 10), (14, 20)], 5, [(0, 20)]),
+    ([(0, 10), (15, 20)], 5, [(0, 20)]),
+    ([(0, 10), (16, 20)], 5, [(0, 10), (16, 20)]),
+    ([(0, 50), (10, 20), (45, 60)], 0, [(0, 60)]),
+])
+def test_merge_intervals(intervals, max_gap, expected):
+    assert merge_intervals(intervals, max_gap) == expected
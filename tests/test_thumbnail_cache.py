@@ -0,0 +1,44 @@
+from thumbnail_cache import LRUCache
+
+
+def test_least_recently_used_entries_are_evicted_first():
+    evicted = []
+    cache = LRUCache(10, on_evict=lambda key, value: evicted.append(key))
+    cache.put("a", 1, 4)
+    cache.put("b", 2, 4)
+    assert cache.get("a") == 1  # a 变成最近使用
+    cache.put("c", 3, 4)
+
+    assert evicted == ["b"]
+    assert "a" in cache and "c" in cache and "b" not in cache
+    assert cache.current_bytes == 8
+
+
+def test_update_replaces_size():
+    cache = LRUCache(10)
+    cache.put("a", 1, 6)
+    cache.put("a", 2, 3)
+    cache.put("b", 3, 7)
+    assert len(cache) == 2
+    assert cache.get("a") == 2
+    assert cache.current_bytes == 10
+
+
+def test_oversized_entry_is_not_cached():
+    cache = LRUCache(10)
+    cache.put("a", 1, 4)
+    cache.put("big", 2, 11)
+    assert "big" not in cache
+    assert cache.get("a") == 1
+    assert cache.current_bytes == 4
+
+
+def test_hits_and_misses():
+    cache = LRUCache(10)
+    cache.put("a", 1, 1)
+    cache.get("a")
+    assert cache.get("missing", "default") == "default"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    cache.clear()
+    assert len(cache) == 0 and cache.current_bytes == 0
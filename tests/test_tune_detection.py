@@ -0,0 +1,52 @@
+import pytest
+
+import tune_detection
+from split_pdf_opencv import DetectionConfig
+
+
+def failing_evaluate_file(config_dict, pdf_path, page_labels, iou_threshold):
+    """dpi 为 72 的参数模拟 OpenCV 在工作进程中报错"""
+    if config_dict["dpi"] == 72:
+        raise RuntimeError("cv2.error")
+    return {"tp": 1, "fp": 0, "fn": 0, "iou_sum": 1.0, "pages": 1, "seconds": 0.5}
+
+
+@pytest.mark.parametrize("changes", [
+    {"adaptive_block_size": 14},
+    {"adaptive_block_size": 1},
+    {"kernel_size": 0},
+    {"min_area_ratio": 1.5},
+    {"min_height_ratio": 0.9, "max_height_ratio": 0.5},
+    {"thumbnail_ink_threshold": 300},
+    {"tile_overlap_px": 3000},
+])
+def test_invalid_config_is_rejected(changes):
+    with pytest.raises(ValueError):
+        DetectionConfig().replace(**changes)
+
+
+def test_expand_grid_reports_invalid_combinations():
+    configs, invalid = tune_detection.expand_grid(
+        {"adaptive_block_size": [15, 16], "kernel_size": [0, 3]})
+
+    assert [(c.adaptive_block_size, c.kernel_size) for c in configs] == [(15, 3)]
+    assert len(invalid) == 3
+    assert {"adaptive_block_size": 16, "kernel_size": 3} in [changes for changes, _ in invalid]
+
+
+def test_failed_config_does_not_abort_sweep(monkeypatch):
+    monkeypatch.setattr(tune_detection, "evaluate_file", failing_evaluate_file)
+    configs = [DetectionConfig(dpi=72), DetectionConfig(dpi=100)]
+    labels = {"a.pdf": {"1": "full"}, "b.pdf": {"1": "full"}}
+
+    results = tune_detection.run_sweep("corpus", labels, configs, workers=2)
+
+    failed, ok = results
+    assert "cv2.error" in failed["error"]
+    assert failed["f1"] == 0.0
+    assert ok["error"] is None
+    assert ok["f1"] == 1.0 and ok["pages"] == 2
+
+    passing, failing = tune_detection.rank_results(results, min_f1=0.95)
+    assert passing == [ok]
+    assert failing == [failed]